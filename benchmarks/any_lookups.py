@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+
+"""
+Compares the old self-joining SQL of the ``any_*`` lookups with the
+correlated EXISTS form, for a growing number of rows.
+"""
+
+from __future__ import print_function
+
+import utils
+
+OLD_SQL = (
+    "SELECT COUNT(*) FROM {table} WHERE {table}.id IN ("
+    "SELECT DISTINCT tmp_table.id FROM {table} AS tmp_table JOIN ("
+    "SELECT tmp_table2.id AS id, unnest(tmp_table2.field::text[]) AS unnest "
+    "FROM {table} AS tmp_table2) AS embedded_table ON embedded_table.id=tmp_table.id "
+    "WHERE embedded_table.unnest LIKE %s)"
+)
+
+
+def populate(model, rows):
+    model.objects.all().delete()
+    model.objects.bulk_create(
+        model(field=["tag-{0}".format(i), "other-{0}".format(i % 97), "x"])
+        for i in range(rows))
+
+
+def main():
+    old_name = utils.setup()
+    try:
+        from django.db import connection
+        from pg_array_fields.models import TextModel
+
+        table = TextModel._meta.db_table
+        old_sql = OLD_SQL.format(table=table)
+        results = [("rows", "self-join (s)", "exists (s)", "speedup")]
+
+        for rows in (1000, 10000, 100000):
+            populate(TextModel, rows)
+            connection.cursor().execute("ANALYZE " + table)
+
+            def run_old():
+                cursor = connection.cursor()
+                cursor.execute(old_sql, ["tag-1%"])
+                cursor.fetchall()
+
+            def run_new():
+                TextModel.objects.filter(field__any_startswith="tag-1").count()
+
+            old, new = utils.timeit(run_old), utils.timeit(run_new)
+            results.append((rows, "%.4f" % old, "%.4f" % new, "%.1fx" % (old / new)))
+
+        qs = TextModel.objects.filter(field__any_startswith="tag-1")
+        sql, params = qs.query.sql_with_params()
+        print("Old plan:\n" + utils.explain(old_sql, ["tag-1%"]) + "\n")
+        print("New plan:\n" + utils.explain(sql, params) + "\n")
+        utils.report("any_startswith", results)
+    finally:
+        utils.teardown(old_name)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+
+"""
+bulk_create throughput for wide numeric arrays, saving them as pre-built
+array literals against psycopg2's default ARRAY[...] rendering.
+"""
+
+from __future__ import print_function
+
+import utils
+
+
+def main():
+    old_name = utils.setup()
+    try:
+        from django.db import models
+        from djorm_pgarray.fields import ArrayField
+        from pg_array_fields.models import IntModel, DoubleModel
+
+        rows, width = 10000, 1000
+        results = [("model", "ARRAY[...] (s)", "literal (s)", "speedup")]
+
+        for model, element in ((IntModel, 7), (DoubleModel, 7.25)):
+            objs = [model(field=[element] * width) for _ in range(rows)]
+
+            def run():
+                model.objects.all().delete()
+                model.objects.bulk_create(objs, batch_size=500)
+
+            new = utils.timeit(run, repeat=1)
+
+            original = ArrayField.__dict__["get_db_prep_save"]
+            ArrayField.get_db_prep_save = models.Field.get_db_prep_save
+            try:
+                old = utils.timeit(run, repeat=1)
+            finally:
+                ArrayField.get_db_prep_save = original
+
+            results.append((model.__name__, "%.2f" % old, "%.2f" % new, "%.1fx" % (old / new)))
+
+        utils.report("bulk_create, %d rows x %d elements" % (rows, width), results)
+    finally:
+        utils.teardown(old_name)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+
+"""
+Measures ArrayField.get_db_prep_value over 1D and 2D arrays against the
+previous per element recursive cast. Does not need a database.
+"""
+
+from __future__ import print_function
+
+import utils
+
+
+def main():
+    import django
+    if django.VERSION[:2] >= (1, 7):
+        django.setup()
+
+    from django.db import connection
+    from django.utils.encoding import force_text
+    from djorm_pgarray.fields import FloatArrayField, IntegerArrayField
+
+    def cast_to_type(data, type_cast):
+        if isinstance(data, (list, tuple)):
+            return [cast_to_type(x, type_cast) for x in data]
+        if type_cast == str:
+            return force_text(data)
+        return type_cast(data)
+
+    results = [("array", "recursive (s)", "compiled (s)", "speedup")]
+    for field in (IntegerArrayField(), FloatArrayField()):
+        for size in (10000, 100000):
+            native = [field._type_cast(i) for i in range(size)]
+            strings = [str(i) for i in range(size)]
+            matrix = [native[i:i + 100] for i in range(0, size, 100)]
+
+            for label, value in (("1D native", native), ("1D str", strings), ("2D native", matrix)):
+                old = utils.timeit(lambda: cast_to_type(value, field._type_cast))
+                new = utils.timeit(lambda: field.get_db_prep_value(value, connection, prepared=True))
+                results.append(("%s %s %d" % (field._array_type.split()[0], label, size),
+                                "%.4f" % old, "%.4f" % new, "%.1fx" % (old / new)))
+
+    utils.report("get_db_prep_value", results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+
+"""
+Per-row model instantiation cost with the lazy array descriptor, against
+the SubfieldBase descriptor the fields used before, which converted on
+every assignment. Rows are built the way querysets build them, from
+positional values. Does not need a database.
+"""
+
+from __future__ import print_function
+
+import utils
+
+
+def main():
+    import django
+    if django.VERSION[:2] >= (1, 7):
+        django.setup()
+
+    from django.db import models
+    from django.utils import six
+    from djorm_pgarray.fields import IntegerArrayField, TextArrayField
+
+    class LegacyIntegerArrayField(six.with_metaclass(models.SubfieldBase, IntegerArrayField)):
+        pass
+
+    class LegacyTextArrayField(six.with_metaclass(models.SubfieldBase, TextArrayField)):
+        pass
+
+    class LazyRow(models.Model):
+        ints = IntegerArrayField()
+        tags = TextArrayField()
+
+        class Meta:
+            app_label = "pg_array_fields"
+
+    class LegacyRow(models.Model):
+        ints = LegacyIntegerArrayField()
+        tags = LegacyTextArrayField()
+
+        class Meta:
+            app_label = "pg_array_fields"
+
+    rows = [(i, list(range(100)), ["tag"] * 100) for i in range(100000)]
+    results = [("access", "SubfieldBase (us)", "lazy (us)")]
+
+    def build(model, touch):
+        def run():
+            for row in rows:
+                obj = model(*row)
+                if touch:
+                    obj.ints, obj.tags
+        return run
+
+    for touch in (False, True):
+        old = utils.timeit(build(LegacyRow, touch))
+        new = utils.timeit(build(LazyRow, touch))
+        results.append(("arrays read" if touch else "arrays unread",
+                        "%.2f" % (old / len(rows) * 1e6), "%.2f" % (new / len(rows) * 1e6)))
+
+    utils.report("Per row instantiation, %d rows" % len(rows), results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+
+"""
+Parsing of array text literals: the pure python parser, parse_array (the
+psycopg2 C parser when usable) and psycopg2's own array typecaster, as
+used when fetching rows. Does not need a database.
+"""
+
+from __future__ import print_function
+
+import utils
+
+
+def main():
+    from psycopg2.extensions import UNICODEARRAY
+    from djorm_pgarray.parser import parse_array, parse_array_python
+
+    samples = [
+        ("1000 ints", "{%s}" % ",".join(str(i) for i in range(1000))),
+        ("1000 quoted", "{%s}" % ",".join('"tag %d"' % i for i in range(1000))),
+        ("100x10 ints", "{%s}" % ",".join("{%s}" % ",".join(str(j) for j in range(10))
+                                          for i in range(100))),
+        ("escapes", "{%s}" % ",".join('"a\\\\b\\"c",NULL' for i in range(500))),
+    ]
+    results = [("literal", "python (ms)", "parse_array (ms)", "psycopg2 (ms)")]
+
+    for label, text in samples:
+        assert parse_array_python(text) == UNICODEARRAY(text, None)
+        times = [utils.timeit(lambda: [func(text) for _ in range(100)]) * 10
+                 for func in (parse_array_python, parse_array,
+                              lambda value: UNICODEARRAY(value, None))]
+        results.append((label,) + tuple("%.3f" % t for t in times))
+
+    utils.report("Array literal parsing, per literal", results)
+
+
+if __name__ == "__main__":
+    main()
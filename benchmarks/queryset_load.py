@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+
+"""
+Cost of loading rows through a real queryset (django >= 1.8), with array
+columns left to the lazy descriptor, against converting every row in
+from_db_value as the fields did before.
+"""
+
+from __future__ import print_function
+
+import utils
+
+
+def main():
+    old_name = utils.setup()
+    try:
+        from djorm_pgarray.fields import ArrayField
+        from pg_array_fields.models import DateModel, TextModel
+
+        rows, width = 20000, 50
+        results = [("model", "access", "eager (s)", "lazy (s)", "speedup")]
+
+        TextModel.objects.bulk_create([TextModel(field=["tag"] * width) for _ in range(rows)])
+        DateModel.objects.bulk_create([DateModel(dates=["2014-01-01"] * width) for _ in range(rows)])
+
+        def eager_from_db_value(self, value, expression, connection, context):
+            return self.to_python(value)
+
+        for model, name in ((TextModel, "field"), (DateModel, "dates")):
+            for touch in (False, True):
+                def run():
+                    for obj in model.objects.all():
+                        if touch:
+                            getattr(obj, name)
+
+                new = utils.timeit(run)
+
+                original = ArrayField.__dict__["from_db_value"]
+                ArrayField.from_db_value = eager_from_db_value
+                try:
+                    old = utils.timeit(run)
+                finally:
+                    ArrayField.from_db_value = original
+
+                results.append((model.__name__, "read" if touch else "unread",
+                                "%.2f" % old, "%.2f" % new, "%.1fx" % (old / new)))
+
+        utils.report("Queryset iteration, %d rows x %d elements" % (rows, width), results)
+    finally:
+        utils.teardown(old_name)
+
+
+if __name__ == "__main__":
+    main()
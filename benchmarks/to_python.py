@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+
+"""
+Measures ArrayField.to_python over lists as returned by psycopg2,
+against the previous recursive unicode walk. Does not need a database.
+"""
+
+from __future__ import print_function
+
+import utils
+
+
+def main():
+    import django
+    if django.VERSION[:2] >= (1, 7):
+        django.setup()
+
+    from djorm_pgarray.fields import IntegerArrayField, TextArrayField, _unserialize
+
+    rows = 10000
+    results = [("field", "walk (s)", "to_python (s)", "speedup")]
+    for field, element in ((IntegerArrayField(), 1), (TextArrayField(), "tag")):
+        values = [[element] * 1000 for _ in range(rows)]
+
+        def run_old():
+            for value in values:
+                _unserialize(value)
+
+        def run_new():
+            to_python = field.to_python
+            for value in values:
+                to_python(value)
+
+        old, new = utils.timeit(run_old), utils.timeit(run_new)
+        results.append((field.__class__.__name__, "%.4f" % old, "%.4f" % new,
+                        "%.1fx" % (old / new)))
+
+    utils.report("to_python, %d rows x 1000 elements" % rows, results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+
+"""
+Shared helpers for the benchmark scripts.
+
+Benchmarks use the same settings and models as the test suite, so
+they need the same PostgreSQL database ``runtests.py`` uses. Run them
+from the repository root::
+
+    python benchmarks/any_lookups.py
+"""
+
+from __future__ import print_function
+
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "testing"))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "settings")
+
+
+def setup():
+    """Configure django and create a throwaway test database."""
+    import django
+    if django.VERSION[:2] >= (1, 7):
+        django.setup()
+
+    from django.db import connection
+    from django.test.utils import setup_test_environment
+
+    setup_test_environment()
+    return connection.creation.create_test_db(verbosity=0, autoclobber=True)
+
+
+def teardown(old_name):
+    from django.db import connection
+    connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+def timeit(func, repeat=3):
+    """Return the best wall-clock time of ``repeat`` runs of ``func``."""
+    best = None
+    for _ in range(repeat):
+        start = time.time()
+        func()
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def explain(sql, params=()):
+    from django.db import connection
+    cursor = connection.cursor()
+    try:
+        cursor.execute("EXPLAIN ANALYZE " + sql, params)
+        return "\n".join(row[0] for row in cursor.fetchall())
+    finally:
+        cursor.close()
+
+
+def report(title, rows):
+    print(title)
+    for row in rows:
+        print("  " + "  ".join("{0:>14}".format(col) for col in row))
+    print()
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+
+"""
+psycopg2 adapters used by the array fields.
+"""
+
+from __future__ import unicode_literals
+
+import binascii
+import datetime
+
+from psycopg2.extensions import Binary, ISQLQuote, QuotedString
+from django.utils import six
+from django.utils.encoding import force_bytes, force_text
+
+
+def format_int(value):
+    return "%d" % value
+
+
+def format_value(value):
+    """Renders a scalar in the postgres text input format."""
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    if isinstance(value, float):
+        return repr(value)
+    if isinstance(value, Binary):
+        value = value.adapted
+    if isinstance(value, memoryview):
+        value = value.tobytes()
+    if isinstance(value, (six.binary_type, bytearray)):
+        return "\\x" + force_text(binascii.hexlify(value))
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+        return value.isoformat()
+    return force_text(value)
+
+
+def quote_element(value):
+    """Renders a non NULL array element, quoted for the array text format."""
+    if isinstance(value, six.integer_types) and not isinstance(value, bool):
+        return "%d" % value
+    if isinstance(value, float):
+        return repr(value)
+    return '"%s"' % format_value(value).replace("\\", "\\\\").replace('"', '\\"')
+
+
+def format_array(data, formatter):
+    """
+    Renders nested lists in the postgres array text format, using
+    ``formatter`` for every non NULL element.
+    """
+    if not data:
+        return "{}"
+    if isinstance(data[0], list):
+        return "{%s}" % ",".join(format_array(x, formatter) for x in data)
+    if None in data:
+        return "{%s}" % ",".join("NULL" if x is None else formatter(x) for x in data)
+    return "{%s}" % ",".join(map(formatter, data))
+
+
+class ArrayLiteral(object):
+    """
+    Renders an array as a single pre-built ``'{...}'::type[]`` literal.
+    psycopg2 renders python lists as ``ARRAY[...]`` quoting every element
+    on its own, which dominates the cost of saving wide arrays, and types
+    it after the python values (text[] for uuid or inet strings).
+
+    Numeric formatters never produce quotes or backslashes, so only other
+    literals go through psycopg2 string quoting.
+    """
+
+    numeric_formatters = (format_int, repr)
+
+    def __init__(self, value, db_type, formatter=repr):
+        self.value = value
+        self.db_type = db_type
+        self.formatter = formatter
+        self.connection = None
+
+    def __conform__(self, protocol):
+        if protocol is ISQLQuote:
+            return self
+
+    def prepare(self, connection):
+        self.connection = connection
+
+    def getquoted(self):
+        literal = format_array(self.value, self.formatter)
+        if self.formatter in self.numeric_formatters:
+            literal = force_bytes("'%s'" % literal)
+        else:
+            literal = QuotedString(literal)
+            if self.connection is not None:
+                literal.prepare(self.connection)
+            literal = literal.getquoted()
+        return literal + force_bytes("::%s" % self.db_type)
+
+    def __str__(self):
+        return self.getquoted().decode("utf-8")
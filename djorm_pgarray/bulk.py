@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+
+"""
+Bulk loading and dumping of models with array fields through ``COPY``,
+which avoids building and parsing huge multi-row INSERT statements, and
+holding a model instance per row when exporting.
+"""
+
+from __future__ import unicode_literals
+
+import re
+
+from django.db import connections, router
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import AutoField
+from django.utils import six
+from django.utils.encoding import force_text
+
+from .adapters import ArrayLiteral, format_array, format_value, quote_element
+from .fields import ArrayField
+from .parser import parse_array
+
+_COPY_ESCAPES = (("\\", "\\\\"), ("\t", "\\t"), ("\n", "\\n"), ("\r", "\\r"))
+_COPY_UNESCAPES = {"t": "\t", "n": "\n", "r": "\r", "b": "\b", "f": "\f", "v": "\v"}
+_COPY_ESCAPE_RE = re.compile(r"\\(.)")
+
+
+def _escape_copy(text):
+    for char, escaped in _COPY_ESCAPES:
+        if char in text:
+            text = text.replace(char, escaped)
+    return text
+
+
+def _column_encoder(field, connection):
+    if isinstance(field, ArrayField):
+        formatter = field._literal_formatter
+
+        def encode(value):
+            value = field.get_db_prep_value(value, connection)
+            if value is None:
+                return "\\N"
+            if isinstance(value, six.string_types):
+                return _escape_copy(value)
+            if formatter in ArrayLiteral.numeric_formatters:
+                return format_array(value, formatter)
+            return _escape_copy(format_array(value, formatter or quote_element))
+    else:
+        def encode(value):
+            value = field.get_db_prep_save(value, connection)
+            if value is None:
+                return "\\N"
+            return _escape_copy(format_value(value))
+    return encode
+
+
+def _unescape_copy(text):
+    if "\\" not in text:
+        return text
+    return _COPY_ESCAPE_RE.sub(lambda m: _COPY_UNESCAPES.get(m.group(1), m.group(1)), text)
+
+
+def _column_decoder(field):
+    if isinstance(field, ArrayField):
+        def decode(text):
+            return field.to_python(field._caster(parse_array(text)))
+        return decode
+    if getattr(field, "rel", None) is not None:
+        return field.related_field.to_python
+    return field.to_python
+
+
+class _LineReader(object):
+    """Minimal file object over an iterator of text lines, for copy_expert."""
+
+    def __init__(self, lines):
+        self.lines = lines
+        self.buffer = b""
+
+    def read(self, size=-1):
+        while size < 0 or len(self.buffer) < size:
+            try:
+                self.buffer += next(self.lines).encode("utf-8")
+            except StopIteration:
+                break
+        if size < 0:
+            size = len(self.buffer)
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+    def readline(self, size=-1):
+        try:
+            return next(self.lines).encode("utf-8")
+        except StopIteration:
+            return b""
+
+
+def copy_insert(model, objs, using=None):
+    """
+    Inserts ``objs`` into the table of ``model`` streaming them through
+    ``COPY ... FROM STDIN``. Like bulk_create, it does not call save(),
+    send signals or set primary keys of the instances. Array columns are
+    encoded in the COPY text format using the type cast of their field.
+
+    Returns the number of inserted rows.
+    """
+    using = using or router.db_for_write(model)
+    connection = connections[using]
+    opts = model._meta
+    fields = [f for f in opts.concrete_fields if not isinstance(f, AutoField)]
+    encoders = [_column_encoder(f, connection) for f in fields]
+    counter = [0]
+
+    def lines():
+        for obj in objs:
+            counter[0] += 1
+            yield "\t".join(encode(f.pre_save(obj, True))
+                            for f, encode in zip(fields, encoders)) + "\n"
+
+    sql = "COPY %s (%s) FROM STDIN" % (
+        connection.ops.quote_name(opts.db_table),
+        ", ".join(connection.ops.quote_name(f.column) for f in fields))
+
+    cursor = connection.cursor()
+    try:
+        cursor.copy_expert(sql, _LineReader(lines()))
+    finally:
+        cursor.close()
+    return counter[0]
+
+
+class _RowWriter(object):
+    """
+    File object for copy_expert that decodes every complete line of COPY
+    text output as soon as it arrives, so only one chunk is held in memory.
+    """
+
+    def __init__(self, decoders, callback):
+        self.decoders = decoders
+        self.callback = callback
+        self.pending = b""
+        self.count = 0
+
+    def write(self, data):
+        if isinstance(data, six.text_type):
+            data = data.encode("utf-8")
+        lines = (self.pending + data).split(b"\n")
+        self.pending = lines.pop()
+        for line in lines:
+            values = line.decode("utf-8").split("\t")
+            self.callback(tuple(None if value == "\\N" else decode(_unescape_copy(value))
+                                for decode, value in zip(self.decoders, values)))
+            self.count += 1
+
+
+def copy_export(queryset, callback, fields=None):
+    """
+    Runs ``COPY (<queryset sql>) TO STDOUT`` and calls ``callback`` with a
+    tuple of python values for every row, as it is streamed from the
+    server. Array columns are parsed from the array text format and cast
+    with the type cast of their field. ``fields`` is a list of field names
+    (all concrete fields by default).
+
+    Returns the number of exported rows.
+    """
+    opts = queryset.model._meta
+    if fields:
+        fields = [opts.get_field(name) for name in fields]
+    else:
+        fields = list(opts.concrete_fields)
+
+    query = queryset.values_list(*[f.name for f in fields]).query
+    sql, params = query.sql_with_params()
+    writer = _RowWriter([_column_decoder(f) for f in fields], callback)
+
+    cursor = connections[queryset.db].cursor()
+    try:
+        sql = force_text(cursor.mogrify(sql, params))
+        cursor.copy_expert("COPY (%s) TO STDOUT" % sql, writer)
+    finally:
+        cursor.close()
+    return writer.count
+
+
+def copy_export_ndjson(queryset, stream, fields=None):
+    """
+    Writes the rows of ``queryset`` to ``stream`` as newline delimited
+    JSON objects keyed by field name, using constant memory.
+
+    Returns the number of exported rows.
+    """
+    opts = queryset.model._meta
+    names = fields or [f.name for f in opts.concrete_fields]
+    # ndarray values of as_numpy fields are written as nested lists
+    numpy_columns = [i for i, name in enumerate(names) if getattr(opts.get_field(name), "_as_numpy", False)]
+    encoder = DjangoJSONEncoder()
+
+    def write(row):
+        if numpy_columns:
+            row = list(row)
+            for i in numpy_columns:
+                if row[i] is not None:
+                    row[i] = row[i].tolist()
+        stream.write(encoder.encode(dict(zip(names, row))) + "\n")
+
+    return copy_export(queryset, write, fields=names)
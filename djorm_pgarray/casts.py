@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+
+"""
+Registry of array element types. Every entry maps postgres type names to
+the function that casts elements to their python type, and optionally to
+the formatter used to save arrays as a single literal. Parametrised names
+like ``numeric(10,2)`` or ``timestamp(3) with time zone`` resolve to their
+base type.
+
+New types can be registered by user code::
+
+    from djorm_pgarray.casts import register_type
+    register_type("hstore", dict)
+"""
+
+from __future__ import unicode_literals
+
+import binascii
+import datetime
+import decimal
+import re
+import uuid
+
+from django.utils import six
+from django.utils.dateparse import parse_date, parse_datetime
+from django.utils.encoding import force_text
+
+from .adapters import format_int, quote_element
+
+_PARAMETERS_RE = re.compile(r"\([^)]*\)")
+_types = {}
+
+
+class ArrayType(object):
+    """
+    Element type information resolved once per field.
+
+    - ``cast``: converts one element to its python type.
+    - ``native``: python type of already converted elements, which are
+      left untouched.
+    - ``literal``: formatter used to save arrays as a single literal, or
+      None to let psycopg2 adapt python lists.
+    - ``cast_on_load``: whether values loaded from the database need the
+      cast too (psycopg2 returns memoryviews for bytea, strings for uuid).
+    """
+
+    def __init__(self, cast, native=None, literal=None, cast_on_load=False):
+        self.cast = cast
+        self.native = native
+        self.literal = literal
+        self.cast_on_load = cast_on_load
+
+
+def normalize_type(dbtype):
+    """Lowercases dbtype and strips type parameters and extra spaces."""
+    return " ".join(_PARAMETERS_RE.sub("", dbtype).lower().split())
+
+
+def register_type(names, cast, native=None, literal=None, cast_on_load=False):
+    """Registers an element type under one or several postgres type names."""
+    array_type = ArrayType(cast, native, literal, cast_on_load)
+    if isinstance(names, six.string_types):
+        names = [names]
+    for name in names:
+        _types[normalize_type(name)] = array_type
+    return array_type
+
+
+def get_type(dbtype):
+    """Returns the ArrayType registered for dbtype, or None."""
+    return _types.get(normalize_type(dbtype))
+
+
+def cast_date(value):
+    if isinstance(value, datetime.datetime):
+        return value.date()
+    if isinstance(value, datetime.date):
+        return value
+    parsed = parse_date(force_text(value))
+    if parsed is None:
+        raise ValueError("Invalid date: %r" % (value,))
+    return parsed
+
+
+def cast_datetime(value):
+    if isinstance(value, datetime.datetime):
+        return value
+    parsed = parse_datetime(force_text(value))
+    if parsed is None:
+        raise ValueError("Invalid datetime: %r" % (value,))
+    return parsed
+
+
+def cast_decimal(value):
+    if isinstance(value, decimal.Decimal):
+        return value
+    try:
+        return decimal.Decimal(force_text(value))
+    except decimal.InvalidOperation:
+        raise ValueError("Invalid decimal: %r" % (value,))
+
+
+def cast_uuid(value):
+    if isinstance(value, uuid.UUID):
+        return value
+    return uuid.UUID(force_text(value))
+
+
+def cast_bytes(value):
+    if isinstance(value, memoryview):
+        return value.tobytes()
+    if isinstance(value, six.text_type):
+        # bytea text output, as found in array literals
+        return binascii.unhexlify(value[2:]) if value.startswith("\\x") else value.encode("latin-1")
+    return six.binary_type(value)
+
+
+# Spellings postgres accepts for boolean input
+_TRUE_VALUES = frozenset(["t", "true", "y", "yes", "on", "1"])
+_FALSE_VALUES = frozenset(["f", "false", "n", "no", "off", "0"])
+
+
+def cast_bool(value):
+    if isinstance(value, six.string_types):
+        lowered = value.strip().lower()
+        if lowered in _TRUE_VALUES:
+            return True
+        if lowered in _FALSE_VALUES:
+            return False
+        raise ValueError("Invalid boolean: %r" % (value,))
+    return bool(value)
+
+
+register_type(["int", "integer", "int4", "smallint", "int2", "bigint", "int8"],
+              int, native=int, literal=format_int)
+register_type(["double precision", "float8", "real", "float4"],
+              float, native=float, literal=repr)
+register_type(["text", "varchar", "character varying", "char", "character", "citext"],
+              force_text, native=six.text_type)
+register_type(["numeric", "decimal"],
+              cast_decimal, native=decimal.Decimal, literal=quote_element)
+register_type(["boolean", "bool"],
+              cast_bool, native=bool)
+register_type("date",
+              cast_date, native=datetime.date, literal=quote_element, cast_on_load=True)
+register_type(["timestamp", "timestamp with time zone", "timestamp without time zone", "timestamptz"],
+              cast_datetime, native=datetime.datetime, literal=quote_element, cast_on_load=True)
+register_type("uuid",
+              cast_uuid, native=uuid.UUID, literal=quote_element, cast_on_load=True)
+register_type(["inet", "cidr", "macaddr"],
+              force_text, native=six.text_type, literal=quote_element, cast_on_load=True)
+register_type("bytea",
+              cast_bytes, native=six.binary_type, literal=quote_element, cast_on_load=True)
@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+
+"""
+Query expressions over arrays (django >= 1.8). Results are typed with
+array or element fields, so they are cast like values loaded from
+array columns.
+"""
+
+from __future__ import unicode_literals
+
+import django
+
+from .fields import array_field_for, element_field_for, subscript_output_field, subscript_sql
+
+if django.VERSION[:2] >= (1, 8):
+    from django.db.models import Aggregate, Func, Value
+    from django.db.models.expressions import Col
+
+    def _value(value):
+        """Wraps plain python values, which Func would take for field names."""
+        return value if hasattr(value, "resolve_expression") else Value(value)
+
+    class ArrayValue(Value):
+        """
+        Array parameter cast to the type of its array field, so it can be
+        combined with columns of types psycopg2 does not infer from python
+        values (varchar[], smallint[], uuid[]...).
+        """
+
+        def __init__(self, value, output_field):
+            super(ArrayValue, self).__init__(value, output_field=output_field)
+
+        def as_sql(self, compiler, connection):
+            sql, params = super(ArrayValue, self).as_sql(compiler, connection)
+            return "%s::%s" % (sql, self.output_field.db_type(connection)), params
+
+    class ArrayAgg(Aggregate):
+        """
+        Collects the values of an expression into an array, optionally
+        without duplicates::
+
+            Article.objects.values("author").annotate(ids=ArrayAgg("id"))
+        """
+
+        function = "ARRAY_AGG"
+        name = "ArrayAgg"
+        template = "%(function)s(%(distinct)s%(expressions)s)"
+
+        def __init__(self, expression, distinct=False, **extra):
+            super(ArrayAgg, self).__init__(expression, distinct="DISTINCT " if distinct else "", **extra)
+
+        def _resolve_output_field(self):
+            return array_field_for(self.get_source_fields()[0])
+
+    class Unnest(Func):
+        """
+        Expands an array into one row per element::
+
+            Item.objects.annotate(tag=Unnest("tags")).values_list("tag", flat=True)
+        """
+
+        function = "unnest"
+
+        def _resolve_output_field(self):
+            return element_field_for(self.get_source_fields()[0])
+
+    class ArrayCat(Func):
+        """
+        Concatenates arrays with the || operator::
+
+            Item.objects.update(tags=ArrayCat("tags", Value(["new"])))
+        """
+
+        template = "(%(expressions)s)"
+        arg_joiner = " || "
+
+    class ArrayAppend(Func):
+        """
+        Appends an element to an array, in a single UPDATE statement::
+
+            Item.objects.filter(pk=1).update(tags=ArrayAppend("tags", "new"))
+        """
+
+        function = "array_append"
+
+        def __init__(self, expression, value, **extra):
+            super(ArrayAppend, self).__init__(expression, _value(value), **extra)
+
+    class ArrayPrepend(Func):
+        """Prepends an element to an array."""
+
+        function = "array_prepend"
+
+        def __init__(self, expression, value, **extra):
+            # postgres takes the element first
+            super(ArrayPrepend, self).__init__(_value(value), expression, **extra)
+
+        def _resolve_output_field(self):
+            return self.get_source_fields()[1]
+
+    class ArrayRemove(Func):
+        """Removes every element equal to value (postgres >= 9.3)."""
+
+        function = "array_remove"
+
+        def __init__(self, expression, value, **extra):
+            super(ArrayRemove, self).__init__(expression, _value(value), **extra)
+
+    class ArrayReplace(Func):
+        """Replaces every element equal to old with new (postgres >= 9.3)."""
+
+        function = "array_replace"
+
+        def __init__(self, expression, old, new, **extra):
+            super(ArrayReplace, self).__init__(expression, _value(old), _value(new), **extra)
+
+    class ArraySetItem(Func):
+        """
+        Sets the element at a 0 based index of a one dimension array, like
+        the index lookups do (``tags__0``). Django updates whole columns, so
+        the array is rebuilt from the slices around the index::
+
+            Item.objects.update(tags=ArraySetItem("tags", 0, "first"))
+        """
+
+        template = ("array_cat(array_append(%(array)s[1:%(index)d], %(value)s), "
+                    "%(array)s[%(next)d:array_upper(%(array)s, 1)])")
+
+        def __init__(self, expression, index, value, **extra):
+            super(ArraySetItem, self).__init__(expression, _value(value), **extra)
+            self.index = index
+
+        def as_sql(self, compiler, connection):
+            expression = self.source_expressions[0]
+            array, array_params = compiler.compile(expression)
+            if not isinstance(expression, Col):
+                array = "(%s)" % array  # function results can not be subscripted as is
+            value, value_params = compiler.compile(self.source_expressions[1])
+            sql = self.template % {"array": array, "value": value,
+                                   "index": self.index, "next": self.index + 2}
+            return sql, array_params + value_params + array_params * 2
+
+    class ArrayIndex(Func):
+        """
+        Element, or sub-array of multidimensional arrays, at 0 based
+        indexes like index lookups (``matrix__0__1``), to be used in
+        annotate(), values() and order_by()::
+
+            Grid.objects.annotate(cell=ArrayIndex("matrix", 0, 1)).order_by("cell")
+        """
+
+        def __init__(self, expression, *indexes, **extra):
+            super(ArrayIndex, self).__init__(expression, **extra)
+            self.indexes = [index + 1 for index in indexes]  # postgres uses 1-indexing
+
+        def _resolve_output_field(self):
+            return subscript_output_field(self.get_source_fields()[0], len(self.indexes))
+
+        def as_sql(self, compiler, connection):
+            expression = self.source_expressions[0]
+            sql, params = compiler.compile(expression)
+            dimension = self.get_source_fields()[0]._dimension
+            return subscript_sql(sql, self.indexes, dimension, not isinstance(expression, Col)), params
+
+    class ArraySlice(Func):
+        """Elements from start to end (0 based, end excluded) like slice lookups (``tags__0_2``)."""
+
+        def __init__(self, expression, start, end, **extra):
+            super(ArraySlice, self).__init__(expression, **extra)
+            self.start = start + 1  # postgres uses 1-indexing and includes the end
+            self.end = end
+
+        def as_sql(self, compiler, connection):
+            expression = self.source_expressions[0]
+            sql, params = compiler.compile(expression)
+            if not isinstance(expression, Col):
+                sql = "(%s)" % sql
+            return "%s[%d:%d]" % (sql, self.start, self.end), params
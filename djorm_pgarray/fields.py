@@ -1,27 +1,42 @@
 from __future__ import unicode_literals
 
 from collections import Iterable
+import copy
 import json
 import django
 
 from django import forms
-from django.core.exceptions import ValidationError
+from django.core.exceptions import ImproperlyConfigured, ValidationError
 from django.core.serializers.json import DjangoJSONEncoder
 from django.core import validators
 from django.db import models
 from django.utils import six
 from django.utils.encoding import force_text
+from django.utils.functional import cached_property
 from django.utils.translation import ugettext_lazy as _
 
+from .adapters import ArrayLiteral
+from .casts import get_type, normalize_type
+from .parser import is_array_literal, parse_array
 
-TYPES = {
-    "int": int,
-    "smallint": int,
-    "bigint": int,
-    "text": force_text,
-    "double precision": float,
-    "varchar": force_text,
-}
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+# Immutable sql function that flattens a text array into a single string,
+# used as the expression of trigram indexes (see operations.CreateTrigramIndex).
+TRIGRAM_FUNCTION = "djorm_pgarray_to_string"
+
+# Immutable sql functions used by the CHECK constraints of unique_items and
+# sorted_items (see operations.CreateArrayCheckFunctions).
+UNIQUE_FUNCTION = "djorm_pgarray_is_unique"
+SORTED_FUNCTION = "djorm_pgarray_is_sorted"
+
+# Element types the order check compares in the "C" collation, which is the
+# codepoint order python sorts strings in.
+COLLATABLE_TYPES = ("text", "varchar", "character varying", "char", "character")
 
 
 def _cast_to_unicode(data):
@@ -32,12 +47,29 @@ def _cast_to_unicode(data):
     return data
 
 
-def _cast_to_type(data, type_cast):
-    if isinstance(data, (list, tuple)):
-        return [_cast_to_type(x, type_cast) for x in data]
+def _build_caster(type_cast, native=None):
+    """
+    Builds the function get_db_prep_value uses to cast array elements,
+    specialized once per field for its element type. Flat lists are cast
+    with a single map() call, and returned untouched when all elements
+    already have the ``native`` type; nested lists are handled per
+    dimension. NULL (None) elements are kept as is.
+    """
     if type_cast == str:
-        return force_text(data)
-    return type_cast(data)
+        type_cast = force_text
+    sequences = (list, tuple)
+
+    def cast(data):
+        if not data or isinstance(data[0], sequences):
+            return [cast(x) if isinstance(x, sequences) else type_cast(x) for x in data]
+        if native is not None and isinstance(data, list) and type(data[0]) is native:
+            if len(set(map(type, data))) == 1:
+                return data
+        if None in data:
+            return [None if x is None else type_cast(x) for x in data]
+        return list(map(type_cast, data))
+
+    return cast
 
 
 def _unserialize(value):
@@ -49,28 +81,208 @@ def _unserialize(value):
         return _cast_to_unicode(value)
 
 
-class ArrayField(six.with_metaclass(models.SubfieldBase, models.Field)):
+def _unserialize_list(value):
+    if isinstance(value, list):
+        return value
+    return _unserialize(value)
+
+
+def _freeze(value):
+    """Immutable copy of an array value, compared to tell whether it changed."""
+    if not isinstance(value, (list, tuple)):
+        return value
+    if value and isinstance(value[0], (list, tuple)):
+        return tuple(_freeze(x) for x in value)
+    return tuple(value)
+
+
+# Instance attribute holding the frozen values of tracked array fields
+# as loaded, by field name (see tracking.ArrayTrackingMixin).
+SNAPSHOTS_ATTRIBUTE = "_djorm_pgarray_snapshots"
+
+# Query context key telling from_db_value whether the query loads model
+# instances, set when the select clause is compiled (django >= 1.8).
+LOADS_INSTANCES_CONTEXT = "djorm_pgarray_loads_instances"
+
+
+def _flatten(value):
+    """Returns the elements of a multidimensional array as a flat list."""
+    if value and isinstance(value[0], (list, tuple)):
+        return [x for row in value for x in _flatten(row)]
+    return list(value)
+
+
+class _RawValue(object):
+    """Value assigned to an array attribute and not converted yet."""
+
+    def __init__(self, value, initial=False):
+        self.value = value
+        self.initial = initial
+
+
+class ArrayFieldDescriptor(object):
+    """
+    Attribute descriptor for array fields. Unlike SubfieldBase, which runs
+    to_python on every assignment (including every row a queryset loads),
+    the assigned value is only converted on the first attribute access.
+
+    On models with ``track_array_changes`` the first assigned value (the
+    loaded one) is kept as initial: it is only snapshotted when it is
+    accessed or replaced, so arrays that are never touched cost nothing.
+    """
+
+    def __init__(self, field):
+        self.field = field
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        value = instance.__dict__[self.field.name]
+        if isinstance(value, _RawValue):
+            raw = value
+            value = instance.__dict__[self.field.name] = self.field.to_python(raw.value)
+            if raw.initial:
+                self.snapshot(instance, value)
+        return value
+
+    def __set__(self, instance, value):
+        name = self.field.name
+        raw = _RawValue(value)
+        if getattr(instance, "track_array_changes", False):
+            if name not in instance.__dict__:
+                raw.initial = True
+            else:
+                current = instance.__dict__[name]
+                if isinstance(current, _RawValue) and current.initial:
+                    self.snapshot(instance, self.field.to_python(current.value))
+        instance.__dict__[name] = raw
+
+    def snapshot(self, instance, value):
+        snapshots = instance.__dict__.setdefault(SNAPSHOTS_ATTRIBUTE, {})
+        snapshots[self.field.name] = _freeze(self.field.get_prep_value(value))
+
+    def has_changed(self, instance):
+        name = self.field.name
+        if name not in instance.__dict__:
+            return False  # deferred
+        current = instance.__dict__[name]
+        if isinstance(current, _RawValue) and current.initial:
+            return False
+        snapshots = instance.__dict__.get(SNAPSHOTS_ATTRIBUTE, {})
+        if name not in snapshots:
+            return True
+        value = self.__get__(instance, type(instance))
+        return _freeze(self.field.get_prep_value(value)) != snapshots[name]
+
+
+class ArrayField(models.Field):
     empty_strings_allowed = False
+    default_error_messages = {
+        "invalid_choices": _("Values %(values)s are not valid choices."),
+        "max_items": _("Ensure this array has at most %(limit_value)d elements (it has %(show_value)d)."),
+        "unique_items": _("Values %(values)s are repeated."),
+        "sorted_items": _("Elements must be sorted."),
+    }
 
     def __init__(self, dbtype="int", type_cast=None, dimension=1, *args, **kwargs):
         self._array_type = dbtype
-        type_key = self._array_type.split("(")[0]
+        array_type = get_type(dbtype)
 
         self._explicit_type_cast = False
+        self._cast_on_load = False
+        self._literal_formatter = None
         if type_cast is not None:
             self._type_cast = type_cast
             self._explicit_type_cast = True
-        elif type_key in TYPES:
-            self._type_cast = TYPES[type_key]
+            self._caster = _build_caster(type_cast)
+        elif array_type is not None:
+            self._type_cast = array_type.cast
+            self._caster = _build_caster(array_type.cast, array_type.native)
+            self._literal_formatter = array_type.literal
+            self._cast_on_load = array_type.cast_on_load
         else:
             self._type_cast = lambda x: x
+            self._caster = _build_caster(self._type_cast)
+
+        # Lists returned by psycopg2 only need the recursive unicode walk
+        # for text arrays under python 2, the rest pass straight through.
+        if six.PY2 and self._type_cast not in (int, float):
+            self._unserialize = _unserialize
+        else:
+            self._unserialize = _unserialize_list
 
         self._dimension = dimension
+        self._gin_index = kwargs.pop("gin_index", False)
+        self._gin_opclass = kwargs.pop("gin_opclass", None)
+        self._max_items = kwargs.pop("max_items", None)
+        self._unique_items = kwargs.pop("unique_items", False)
+        self._sorted_items = kwargs.pop("sorted_items", False)
         kwargs.setdefault("blank", True)
         kwargs.setdefault("null", True)
         kwargs.setdefault("default", None)
         super(ArrayField, self).__init__(*args, **kwargs)
 
+    def contribute_to_class(self, cls, name, **kwargs):
+        super(ArrayField, self).contribute_to_class(cls, name, **kwargs)
+        setattr(cls, self.name, ArrayFieldDescriptor(self))
+
+    def check(self, **kwargs):
+        errors = super(ArrayField, self).check(**kwargs)
+        errors.extend(self._check_gin_index())
+        return errors
+
+    def _check_gin_index(self):
+        """
+        Warns when a field declared with gin_index=True has no
+        CreateGinIndex operation in the migrations of its app, since
+        django can not create the index by itself.
+        """
+        if not self._gin_index or not self.model._meta.managed:
+            return []
+        from django.core import checks
+        from django.db.migrations.loader import MigrationLoader
+        from .operations import CreateGinIndex
+
+        app_label, model_name = self.model._meta.app_label, self.model._meta.model_name
+        for (label, name), migration in MigrationLoader(None).disk_migrations.items():
+            for operation in migration.operations if label == app_label else ():
+                if (isinstance(operation, CreateGinIndex) and operation.method == "gin" and
+                        operation.model_name.lower() == model_name and
+                        operation.name.lower() == self.name.lower()):
+                    return []
+        return [
+            checks.Warning(
+                "gin_index=True does not create the index by itself.",
+                hint="Add CreateGinIndex('%s', '%s') to a migration of %s." % (
+                    self.model._meta.object_name, self.name, app_label),
+                obj=self,
+                id="djorm_pgarray.W001",
+            )
+        ]
+
+    def has_changed(self, instance):
+        """
+        Tells whether the value of this field on a model instance differs
+        from the loaded one. Only meaningful on models with
+        ``track_array_changes``, otherwise values always count as changed.
+        """
+        return ArrayFieldDescriptor(self).has_changed(instance)
+
+    def select_format(self, compiler, sql, params):
+        # Only queries selecting the default columns build model instances,
+        # values() and values_list() select their own.
+        compiler.query.context[LOADS_INSTANCES_CONTEXT] = compiler.query.default_cols
+        return super(ArrayField, self).select_format(compiler, sql, params)
+
+    def from_db_value(self, value, expression, connection, context):
+        # Columns loaded into model instances are assigned as loaded, and
+        # converted once by the descriptor on first access. Computed values
+        # (annotations, aggregates typed with an array field) and the rows
+        # of values()/values_list() are converted here.
+        if getattr(expression, "target", None) is self and context.get(LOADS_INSTANCES_CONTEXT):
+            return value
+        return self.to_python(value)
+
     def get_db_prep_lookup(self, lookup_type, value, connection, prepared=False):
         if lookup_type == "contains":
             return [self.get_prep_value(value)]
@@ -78,6 +290,8 @@ class ArrayField(six.with_metaclass(models.SubfieldBase, models.Field)):
 
     def formfield(self, **params):
         params.setdefault("form_class", ArrayFormField)
+        if isinstance(params["form_class"], type) and issubclass(params["form_class"], ArrayFormField):
+            params.setdefault("coerce", self._type_cast)
 
         # Django 1.5 does not support "choices_form_class" parameter
         if django.VERSION[:2] >= (1, 6):
@@ -92,13 +306,24 @@ class ArrayField(six.with_metaclass(models.SubfieldBase, models.Field)):
         value = value if prepared else self.get_prep_value(value)
         if not value or isinstance(value, six.string_types):
             return value
-        return _cast_to_type(value, self._type_cast)
+        return self._caster(value)
+
+    def get_db_prep_save(self, value, connection):
+        value = super(ArrayField, self).get_db_prep_save(value, connection)
+        if self._literal_formatter is not None and isinstance(value, list):
+            return ArrayLiteral(value, self.db_type(connection), self._literal_formatter)
+        return value
 
     def get_prep_value(self, value):
         return value if isinstance(value, (six.string_types, list,)) or not isinstance(value, Iterable) else list(value)
 
     def to_python(self, value):
-        return _unserialize(value)
+        if isinstance(value, six.string_types) and is_array_literal(value):
+            return self._caster(parse_array(value))
+        value = self._unserialize(value)
+        if self._cast_on_load and isinstance(value, list):
+            return self._caster(value)
+        return value
 
     def value_to_string(self, obj):
         value = self._get_val_from_obj(obj)
@@ -112,8 +337,95 @@ class ArrayField(six.with_metaclass(models.SubfieldBase, models.Field)):
         if not self.blank and value in validators.EMPTY_VALUES:
             raise ValidationError(self.error_messages['blank'])
 
-        for val in value:
-            super(ArrayField, self).validate(val, model_instance)
+        if not value or not self.editable:
+            return
+
+        if self._dimension > 1:
+            value = _flatten(value)
+
+        if self.choices:
+            choice_values = self.get_choice_values()
+            if not choice_values.issuperset(value):
+                # Empty elements are left to the null and blank checks
+                invalid = []
+                for val in value:
+                    if val not in choice_values and val not in invalid and val not in validators.EMPTY_VALUES:
+                        invalid.append(val)
+                if invalid:
+                    raise ValidationError(self.error_messages['invalid_choices'], code='invalid_choices',
+                                          params={'values': ", ".join(force_text(x) for x in invalid)})
+
+        if not self.null and None in value:
+            raise ValidationError(self.error_messages['null'], code='null')
+
+        if not self.blank and "" in value:
+            raise ValidationError(self.error_messages['blank'], code='blank')
+
+        if self._max_items is not None and len(value) > self._max_items:
+            raise ValidationError(self.error_messages['max_items'], code='max_items',
+                                  params={'limit_value': self._max_items, 'show_value': len(value)})
+
+        # NULL elements are ignored, like the database checks do
+        if self._unique_items or self._sorted_items:
+            elements = [x for x in value if x is not None]
+
+        if self._unique_items and len(set(elements)) != len(elements):
+            seen, repeated = set(), []
+            for val in elements:
+                if val in seen and val not in repeated:
+                    repeated.append(val)
+                seen.add(val)
+            raise ValidationError(self.error_messages['unique_items'], code='unique_items',
+                                  params={'values': ", ".join(force_text(x) for x in repeated)})
+
+        if self._sorted_items and elements != sorted(elements):
+            raise ValidationError(self.error_messages['sorted_items'], code='sorted_items')
+
+    def get_check_constraint(self, connection):
+        """
+        Returns the condition of the CHECK constraint of max_items,
+        unique_items and sorted_items, with every condition joined by AND,
+        or None. The uniqueness and order checks call the functions
+        installed by operations.CreateArrayCheckFunctions, since CHECK
+        constraints can not contain subqueries. Text elements are ordered
+        in the "C" collation, as validate() orders them.
+        """
+        if self._max_items is None and not self._unique_items and not self._sorted_items:
+            return None
+        column = connection.ops.quote_name(self.column)
+        checks = []
+        if self._max_items is not None:
+            checks.append("cardinality(%s) <= %d" % (column, self._max_items))
+        if self._unique_items:
+            checks.append("%s(%s)" % (UNIQUE_FUNCTION, column))
+        if self._sorted_items:
+            if normalize_type(self._array_type) in COLLATABLE_TYPES:
+                checks.append('%s(%s COLLATE "C")' % (SORTED_FUNCTION, column))
+            else:
+                checks.append("%s(%s)" % (SORTED_FUNCTION, column))
+        return " AND ".join(checks) or None
+
+    def db_parameters(self, connection):
+        # The schema editor of django >= 1.7 supports a single check per
+        # column, so the constraint is added to the one of the backend.
+        parameters = super(ArrayField, self).db_parameters(connection)
+        checks = [parameters["check"], self.get_check_constraint(connection)]
+        parameters["check"] = " AND ".join(check for check in checks if check) or None
+        return parameters
+
+    def get_choice_values(self):
+        """
+        Returns the frozen set of valid element values, built once and
+        rebuilt when other choices are assigned to the field. Choices
+        changed in place are only seen once assigned again.
+        """
+        choices = self._choices
+        if not isinstance(choices, (list, tuple)):
+            return frozenset(_choice_values(self.choices))
+        cached = getattr(self, "_choice_values_cache", None)
+        if cached is None or cached[0] is not choices:
+            cached = self._choice_values_cache = (choices, frozenset(_choice_values(choices)))
+        return cached[1]
 
     def deconstruct(self):
         name, path, args, kwargs = super(ArrayField, self).deconstruct()
@@ -123,6 +435,16 @@ class ArrayField(six.with_metaclass(models.SubfieldBase, models.Field)):
             kwargs["dimension"] = self._dimension
         if self._explicit_type_cast:
             kwargs["type_cast"] = self._type_cast
+        if self._gin_index:
+            kwargs["gin_index"] = True
+        if self._gin_opclass is not None:
+            kwargs["gin_opclass"] = self._gin_opclass
+        if self._max_items is not None:
+            kwargs["max_items"] = self._max_items
+        if self._unique_items:
+            kwargs["unique_items"] = True
+        if self._sorted_items:
+            kwargs["sorted_items"] = True
         if self.blank:
             kwargs.pop("blank", None)
         else:
@@ -146,6 +468,14 @@ class ArrayField(six.with_metaclass(models.SubfieldBase, models.Field)):
 
         if transform:
             return transform
+        if name.startswith("len_"):
+            try:
+                dimension = int(name[4:])
+            except ValueError:
+                return None
+            if 1 <= dimension <= self._dimension:
+                return ArrayLenTransformFactory(dimension)
+            return None
         try:
             index = int(name)
         except ValueError:
@@ -160,22 +490,95 @@ class ArrayField(six.with_metaclass(models.SubfieldBase, models.Field)):
         except ValueError:
             pass
         else:
-            return SliceTransformFactory(start, end)
+            return SliceTransformFactory(start, end, self)
+
+
+class NumpyArrayMixin(object):
+    """
+    Optional numpy support for numeric array fields. With as_numpy=True
+    values are returned as numpy ndarrays of the given dtype (shaped by
+    the field dimension), and ndarrays are accepted on save without
+    going through python lists element by element.
+    """
 
+    default_dtype = None
 
-class IntegerArrayField(ArrayField):
     def __init__(self, *args, **kwargs):
+        self._as_numpy = kwargs.pop("as_numpy", False)
+        self._dtype = kwargs.pop("dtype", None)
+        if self._as_numpy and numpy is None:
+            raise ImproperlyConfigured("as_numpy=True requires numpy to be installed.")
+        super(NumpyArrayMixin, self).__init__(*args, **kwargs)
+
+    def get_prep_value(self, value):
+        if numpy is not None and isinstance(value, numpy.ndarray):
+            return value.tolist()
+        return super(NumpyArrayMixin, self).get_prep_value(value)
+
+    def to_python(self, value):
+        if not self._as_numpy or value is None or isinstance(value, numpy.ndarray):
+            return super(NumpyArrayMixin, self).to_python(value)
+        value = super(NumpyArrayMixin, self).to_python(value)
+        return numpy.array(value, dtype=self._dtype or self.default_dtype, ndmin=self._dimension)
+
+    def validate(self, value, model_instance):
+        if numpy is not None and isinstance(value, numpy.ndarray):
+            value = value.tolist()
+        super(NumpyArrayMixin, self).validate(value, model_instance)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super(NumpyArrayMixin, self).deconstruct()
+        if self._as_numpy:
+            kwargs["as_numpy"] = True
+        if self._dtype is not None:
+            kwargs["dtype"] = self._dtype
+        return name, path, args, kwargs
+
+
+class IntegerArrayField(NumpyArrayMixin, ArrayField):
+    default_dtype = "int32"
+
+    def __init__(self, *args, **kwargs):
+        self._intarray = kwargs.pop("intarray", False)
         kwargs.setdefault("dbtype", "int")
         super(IntegerArrayField, self).__init__(*args, **kwargs)
+        if self._intarray and (self._dimension != 1 or normalize_type(self._array_type) not in ("int", "integer", "int4")):
+            raise ImproperlyConfigured("intarray=True requires a one dimension int4 array.")
+
+    def deconstruct(self):
+        name, path, args, kwargs = super(IntegerArrayField, self).deconstruct()
+        if self._intarray:
+            kwargs["intarray"] = True
+        return name, path, args, kwargs
+
+    def get_transform(self, name):
+        transform = super(IntegerArrayField, self).get_transform(name)
+
+        if transform:
+            return transform
+        try:
+            function, args = name.split("_", 1)
+            args = [int(x) for x in args.split("_")]
+        except ValueError:
+            return None
+        if function == "idx" and len(args) == 1:
+            return IntarrayFunctionTransformFactory("idx", args, models.IntegerField())
+        if function == "subarray" and len(args) == 2:
+            args[0] += 1  # postgres uses 1-indexing
+            return IntarrayFunctionTransformFactory("subarray", args)
+
 
+class SmallIntegerArrayField(NumpyArrayMixin, ArrayField):
+    default_dtype = "int16"
 
-class SmallIntegerArrayField(ArrayField):
     def __init__(self, *args, **kwargs):
         kwargs.setdefault("dbtype", "smallint")
         super(SmallIntegerArrayField, self).__init__(*args, **kwargs)
 
 
-class BigIntegerArrayField(ArrayField):
+class BigIntegerArrayField(NumpyArrayMixin, ArrayField):
+    default_dtype = "int64"
+
     def __init__(self, *args, **kwargs):
         kwargs.setdefault("dbtype", "bigint")
         super(BigIntegerArrayField, self).__init__(*args, **kwargs)
@@ -183,11 +586,20 @@ class BigIntegerArrayField(ArrayField):
 
 class TextArrayField(ArrayField):
     def __init__(self, *args, **kwargs):
+        self._trigram_index = kwargs.pop("trigram_index", False)
         kwargs.setdefault("dbtype", "text")
         super(TextArrayField, self).__init__(*args, **kwargs)
 
+    def deconstruct(self):
+        name, path, args, kwargs = super(TextArrayField, self).deconstruct()
+        if self._trigram_index:
+            kwargs["trigram_index"] = True
+        return name, path, args, kwargs
+
+
+class FloatArrayField(NumpyArrayMixin, ArrayField):
+    default_dtype = "float64"
 
-class FloatArrayField(ArrayField):
     def __init__(self, *args, **kwargs):
         kwargs.setdefault("dbtype", "double precision")
         super(FloatArrayField, self).__init__(*args, **kwargs)
@@ -205,36 +617,194 @@ class DateTimeArrayField(ArrayField):
         super(DateTimeArrayField, self).__init__(*args, **kwargs)
 
 
+# Array element types of django model fields, by internal type.
+ELEMENT_DBTYPES = {
+    "AutoField": "int",
+    "IntegerField": "int",
+    "PositiveIntegerField": "int",
+    "SmallIntegerField": "smallint",
+    "PositiveSmallIntegerField": "smallint",
+    "BigIntegerField": "bigint",
+    "FloatField": "double precision",
+    "DecimalField": "numeric",
+    "BooleanField": "boolean",
+    "CharField": "varchar",
+    "SlugField": "varchar",
+    "EmailField": "varchar",
+    "TextField": "text",
+    "DateField": "date",
+    "DateTimeField": "timestamp with time zone",
+    "UUIDField": "uuid",
+    "GenericIPAddressField": "inet",
+    "BinaryField": "bytea",
+}
+
+# Model fields of single array elements, by normalized element type.
+ELEMENT_FIELDS = {
+    "int": models.IntegerField,
+    "smallint": models.SmallIntegerField,
+    "bigint": models.BigIntegerField,
+    "double precision": models.FloatField,
+    "boolean": models.BooleanField,
+    "date": models.DateField,
+    "timestamp with time zone": models.DateTimeField,
+}
+
+# Array field classes, by normalized element type.
+ARRAY_FIELDS = {
+    "int": IntegerArrayField,
+    "smallint": SmallIntegerArrayField,
+    "bigint": BigIntegerArrayField,
+    "text": TextArrayField,
+    "double precision": FloatArrayField,
+    "date": DateArrayField,
+    "timestamp with time zone": DateTimeArrayField,
+}
+
+
+def array_field_for(field):
+    """
+    Returns an unbound array field holding values of the given model
+    field, as produced by array_agg(). Array fields add one dimension.
+    """
+    if isinstance(field, ArrayField):
+        return array_field_with_dimension(field, field._dimension + 1)
+    while getattr(field, "rel", None) is not None:
+        field = field.rel.get_related_field()
+    dbtype = ELEMENT_DBTYPES.get(field.get_internal_type(), "text")
+    return ARRAY_FIELDS.get(dbtype, ArrayField)(dbtype=dbtype)
+
+
+def element_field_for(field):
+    """Returns an unbound model field for single elements of an array field."""
+    field_class = ELEMENT_FIELDS.get(normalize_type(field._array_type), models.TextField)
+    return field_class()
+
+
+def array_field_with_dimension(field, dimension):
+    """Returns an unbound copy of an array field with another dimension."""
+    name, path, args, kwargs = field.deconstruct()
+    kwargs["dimension"] = dimension
+    return field.__class__(*args, **kwargs)
+
+
+def subscript_output_field(field, count):
+    """
+    Returns the field of the values of an array field subscripted count
+    times, matching subscript_sql(): an element, a one dimension array, or
+    an array of the same dimension when more than one dimension is left.
+    """
+    if count >= field._dimension:
+        return element_field_for(field)
+    if field._dimension - count == 1:
+        return array_field_with_dimension(field, 1)
+    return array_field_with_dimension(field, field._dimension)
+
+
+def subscript_sql(lhs, indexes, dimension, wrap=False):
+    """
+    Renders 1 based subscripts of an array expression of the given
+    dimension. Subscripting every dimension returns an element. Postgres
+    returns NULL for fewer subscripts, so those are rendered as slices of
+    length one, flattened with unnest() when one dimension is left. With
+    more dimensions left the slice keeps its leading dimensions of length
+    one (``matrix3d__0`` is ``[[[1, 2], [3, 4]]]``), since unnest() can't
+    rebuild an array of arrays.
+    """
+    if wrap:
+        lhs = "(%s)" % lhs
+    if len(indexes) >= dimension:
+        return lhs + "".join("[%d]" % index for index in indexes)
+    sql = lhs + "".join("[%d:%d]" % (index, index) for index in indexes)
+    if dimension - len(indexes) == 1:
+        return "ARRAY(SELECT unnest(%s))" % sql
+    return sql
+
+
+def _choice_values(choices, coerce=None):
+    """Yields the values of a choices list, looking into option groups."""
+    for key, label in choices:
+        if isinstance(label, (list, tuple)):
+            for value in _choice_values(label, coerce):
+                yield value
+        else:
+            yield key if coerce is None else coerce(key)
+
+
 class ArrayFormField(forms.Field):
     default_error_messages = {
         "invalid": _("Enter a list of values, joined by commas.  E.g. \"a,b,c\"."),
+        "invalid_item": _("Enter valid values: %(values)s."),
+        "invalid_choice": _("Select valid choices. %(values)s are not among the available choices."),
+        "max_length": _("Ensure this list has at most %(limit_value)d elements (it has %(show_value)d)."),
+        "min_length": _("Ensure this list has at least %(limit_value)d elements (it has %(show_value)d)."),
     }
 
     def __init__(self, max_length=None, min_length=None, delim=None,
-                 strip=True, *args, **kwargs):
+                 strip=True, coerce=None, choices=None, *args, **kwargs):
         if delim is not None:
             self.delim = delim
         else:
             self.delim = u","
 
         self.strip = strip
+        self.max_length = max_length
+        self.min_length = min_length
+        self.coerce = coerce
+        self.choice_values = None
+        if choices is not None:
+            self.choice_values = frozenset(_choice_values(choices, coerce))
 
         super(ArrayFormField, self).__init__(*args, **kwargs)
 
+    def check_length(self, length):
+        if self.max_length is not None and length > self.max_length:
+            raise ValidationError(self.error_messages["max_length"], code="max_length",
+                                  params={"limit_value": self.max_length, "show_value": length})
+        if self.min_length is not None and length < self.min_length:
+            raise ValidationError(self.error_messages["min_length"], code="min_length",
+                                  params={"limit_value": self.min_length, "show_value": length})
+
     def clean(self, value):
+        """
+        Splits, strips and coerces the elements in a single pass, after
+        checking the number of elements, so oversized input is rejected
+        before building any list. Every invalid element is reported at once.
+        """
         if not value:
             return []
 
         # If Django already parsed value to list
-        if isinstance(value, list):
-            return value
-
-        try:
-            value = value.split(self.delim)
+        if not isinstance(value, list):
+            try:
+                if self.max_length is not None:
+                    self.check_length(value.count(self.delim) + 1)
+                value = value.split(self.delim)
+            except AttributeError:
+                raise ValidationError(self.error_messages["invalid"])
             if self.strip:
                 value = [x.strip() for x in value]
-        except Exception:
-            raise ValidationError(self.error_messages["invalid"])
+
+        self.check_length(len(value))
+
+        if self.coerce is not None:
+            try:
+                value = list(map(self.coerce, value))
+            except (ValueError, TypeError, ValidationError):
+                invalid = []
+                for x in value:
+                    try:
+                        self.coerce(x)
+                    except (ValueError, TypeError, ValidationError):
+                        invalid.append(force_text(x))
+                raise ValidationError(self.error_messages["invalid_item"], code="invalid_item",
+                                      params={"values": ", ".join(invalid)})
+
+        if self.choice_values is not None:
+            invalid = [force_text(x) for x in value if x not in self.choice_values]
+            if invalid:
+                raise ValidationError(self.error_messages["invalid_choice"], code="invalid_choice",
+                                      params={"values": ", ".join(invalid)})
 
         return value
 
@@ -252,54 +822,151 @@ class ArrayFormField(forms.Field):
 if django.VERSION[:2] >= (1, 7):
     from django.db.models import Lookup, Transform
 
-    class ContainsLookup(Lookup):
-        lookup_name = "contains"
+    class ArrayOperatorLookup(Lookup):
+        operator = None
+
+        def get_operator(self, connection):
+            return self.operator
 
         def as_sql(self, qn, connection):
             lhs, lhs_params = self.process_lhs(qn, connection)
             rhs, rhs_params = self.process_rhs(qn, connection)
             params = lhs_params + rhs_params
-            var = "%s @> %s" % (lhs, rhs), params
-            return var
+            return "%s %s %s" % (lhs, self.get_operator(connection), rhs), params
 
-    class ContainedByLookup(Lookup):
-        lookup_name = "contained_by"
+    class ContainsLookup(ArrayOperatorLookup):
+        lookup_name = "contains"
+        operator = "@>"
 
-        def as_sql(self, qn, connection):
-            lhs, lhs_params = self.process_lhs(qn, connection)
-            rhs, rhs_params = self.process_rhs(qn, connection)
-            params = lhs_params + rhs_params
-            return "%s <@ %s" % (lhs, rhs), params
+    class ContainedByLookup(ArrayOperatorLookup):
+        lookup_name = "contained_by"
+        operator = "<@"
 
-    class OverlapLookup(Lookup):
+    class OverlapLookup(ArrayOperatorLookup):
         lookup_name = "overlap"
+        operator = "&&"
+
+    class AnyValueLookup(Lookup):
+        """
+        Scalar column equal to any value of a list (``id__any=[1, 2, 3]``).
+        Unlike ``__in`` the list is bound as one array parameter, cast to
+        the array type of the column (``= ANY(%s::int[])``), so the
+        statement text does not depend on the number of values.
+
+        Registered on the fields with a known array type (ELEMENT_DBTYPES).
+        The right hand side must be a list of values: querysets and
+        expressions have no array parameter to bind, use ``__in``.
+        """
+        lookup_name = "any"
+
+        def get_prep_lookup(self):
+            field = self.lhs.output_field
+            while getattr(field, "rel", None) is not None:
+                field = field.rel.get_related_field()
+            if field.get_internal_type() not in ELEMENT_DBTYPES:
+                raise TypeError("The any lookup does not support %s." % field.get_internal_type())
+            if any(hasattr(self.rhs, attr) for attr in ("query", "get_compiler", "as_sql", "resolve_expression")):
+                raise ValueError("The any lookup takes a list of values, use in for querysets and expressions.")
+            return [field.get_prep_value(x) for x in self.rhs]
+
+        def get_db_prep_lookup(self, value, connection):
+            field = array_field_for(self.lhs.output_field)
+            return "%%s::%s" % field.db_type(connection), [field.get_db_prep_value(value, connection)]
 
         def as_sql(self, qn, connection):
             lhs, lhs_params = self.process_lhs(qn, connection)
             rhs, rhs_params = self.process_rhs(qn, connection)
             params = lhs_params + rhs_params
-            return "%s && %s" % (lhs, rhs), params
+            return "%s = ANY(%s)" % (lhs, rhs), params
+
+    class ParametrizedTransformMixin(object):
+        """
+        Keeps the arguments of transforms built by factories when django
+        1.7 clones them, which it does calling the class with the lhs only.
+        """
+
+        if django.VERSION[:2] < (1, 8):
+            def relabeled_clone(self, relabels):
+                clone = copy.copy(self)
+                clone.lhs = self.lhs.relabeled_clone(relabels)
+                return clone
+
+    class ArrayLenTransform(ParametrizedTransformMixin, Transform):
+        """
+        Length of one dimension of an array: ``len`` for the first one,
+        ``len_<n>`` for the n-th. NULL for empty arrays.
+        """
 
-    class ArrayLenTransform(Transform):
         lookup_name = "len"
 
+        def __init__(self, *args, **kwargs):
+            self.dimension = kwargs.pop("dimension", 1)
+            super(ArrayLenTransform, self).__init__(*args, **kwargs)
+
         @property
-        def output_type(self):
+        def output_field(self):
             return models.IntegerField()
 
         def as_sql(self, qn, connection):
             lhs, params = qn.compile(self.lhs)
-            return "array_length(%s, 1)" % lhs, params
+            return "array_length(%s, %d)" % (lhs, self.dimension), params
+
+    class ArrayFunctionTransform(Transform):
+        function = None
+
+        def as_sql(self, qn, connection):
+            lhs, params = qn.compile(self.lhs)
+            return "%s(%s)" % (self.function, lhs), params
+
+    class CardinalityTransform(ArrayFunctionTransform):
+        """Number of elements across all dimensions, 0 for empty arrays (postgres >= 9.4)."""
+
+        lookup_name = "cardinality"
+        function = "cardinality"
+
+        @property
+        def output_field(self):
+            return models.IntegerField()
+
+    class NdimsTransform(ArrayFunctionTransform):
+        lookup_name = "ndims"
+        function = "array_ndims"
+
+        @property
+        def output_field(self):
+            return models.IntegerField()
+
+    class DimsTransform(ArrayFunctionTransform):
+        """Text representation of the array bounds, like ``[1:2][1:3]``."""
+
+        lookup_name = "dims"
+        function = "array_dims"
+
+        @property
+        def output_field(self):
+            return models.TextField()
 
     class AnyBaseLookup(Lookup):
         comparator = "="
         """self.comparator holds the comparison operator to be applied to the condition"""
+        pattern = "%s"
+        """self.pattern wraps the searched value with the wildcards of the lookup"""
+
+        def process_rhs(self, qn, connection, pattern=None):
+            rhs, rhs_params = super(AnyBaseLookup, self).process_rhs(qn, connection)
+            pattern = pattern or self.pattern
+            return rhs, [pattern % param for param in rhs_params]
 
         def as_sql(self, qn, connection):
             """
-            Basically, the array gets split up into rows (unnested) such that we can apply string comparators on the
-            array's contents. Once these operations have been applied, the resulting set of PKs is used to identify,
-            for what rows the given condition is true.
+            The array of the current row gets unnested inside a correlated EXISTS subquery, so
+            the condition is evaluated per row and stops at the first matching element. Being a
+            plain row predicate it combines with the rest of the WHERE clause of the outer query
+            instead of rescanning the whole table.
+
+            Text arrays declared with trigram_index=True are first filtered by a substring match
+            over the flattened array, which a pg_trgm GIN index can serve, and only the candidate
+            rows are checked element by element.
             :param qn: The SQLCompiler object used for compiling this query
             :param connection: A DatabaseWrapper object
             :return: a tuple (condition_string, parameter)
@@ -307,33 +974,27 @@ if django.VERSION[:2] >= (1, 7):
             lhs, lhs_params = self.process_lhs(qn, connection)
             rhs, rhs_params = self.process_rhs(qn, connection)
             params = lhs_params + rhs_params
-            table = self.lhs.alias
-            pk_name = qn.query.model._meta.pk.name
-            table_dot_pk_name = "%s.%s" % (table, pk_name)
-            return "{table_dot_pk_name} IN (" \
-                   "SELECT DISTINCT tmp_table.{pk_name} " \
-                   "FROM {table} AS tmp_table " \
-                   "JOIN ( " \
-                   "SELECT tmp_table2.{pk_name} AS id, unnest({arrayfield_name}::text[]) AS unnest " \
-                   "FROM {table} AS tmp_table2) AS embedded_table ON embedded_table.{pk_name}=tmp_table.{pk_name} " \
-                   "WHERE embedded_table.unnest {comparator} %s)".format(table_dot_pk_name=table_dot_pk_name,
-                                                                         pk_name=pk_name, table=table,
-                                                                         arrayfield_name=lhs,
-                                                                         comparator=self.comparator) % (
-                       rhs, ), params
+            sql = "EXISTS (" \
+                  "SELECT 1 FROM unnest({arrayfield_name}::text[]) AS elem " \
+                  "WHERE elem {comparator} {rhs})".format(arrayfield_name=lhs,
+                                                         comparator=self.comparator,
+                                                         rhs=rhs)
+
+            if getattr(self.lhs.output_field, "_trigram_index", False):
+                rhs, prefilter_params = self.process_rhs(qn, connection, pattern="%%%s%%")
+                prefilter = "{function}({arrayfield_name}) {comparator} {rhs}".format(
+                    function=TRIGRAM_FUNCTION, arrayfield_name=lhs,
+                    comparator=self.comparator, rhs=rhs)
+                sql = "(%s AND %s)" % (prefilter, sql)
+                params = lhs_params + prefilter_params + params
+
+            return sql, params
 
 
     class AnyStartswithLookup(AnyBaseLookup):
         lookup_name = "any_startswith"
         comparator = "LIKE"
-
-        def process_rhs(self, qn, connection):
-            wildcarded_rhs_params = []
-            rhs, rhs_params = super(AnyStartswithLookup, self).process_rhs(qn, connection)
-            for param in rhs_params:
-                param = "%s%%" % param
-                wildcarded_rhs_params.append(param)
-            return rhs, wildcarded_rhs_params
+        pattern = "%s%%"
 
 
     class AnyIStartswithLookup(AnyStartswithLookup):
@@ -344,14 +1005,7 @@ if django.VERSION[:2] >= (1, 7):
     class AnyEndswithLookup(AnyBaseLookup):
         lookup_name = "any_endswith"
         comparator = "LIKE"
-
-        def process_rhs(self, qn, connection):
-            wildcarded_rhs_params = []
-            rhs, rhs_params = super(AnyEndswithLookup, self).process_rhs(qn, connection)
-            for param in rhs_params:
-                param = "%%%s" % param
-                wildcarded_rhs_params.append(param)
-            return rhs, wildcarded_rhs_params
+        pattern = "%%%s"
 
 
     class AnyIEndswithLookup(AnyEndswithLookup):
@@ -362,24 +1016,23 @@ if django.VERSION[:2] >= (1, 7):
     class AnyContainsLookup(AnyBaseLookup):
         lookup_name = "any_contains"
         comparator = "LIKE"
-
-        def process_rhs(self, qn, connection):
-            wildcarded_rhs_params = []
-            rhs, rhs_params = super(AnyContainsLookup, self).process_rhs(qn, connection)
-            for param in rhs_params:
-                param = "%%%s%%" % param
-                wildcarded_rhs_params.append(param)
-            return rhs, wildcarded_rhs_params
+        pattern = "%%%s%%"
 
 
     class AnyIContainsLookup(AnyContainsLookup):
         lookup_name = "any_icontains"
         comparator = "ILIKE"
 
+    for internal_type in ELEMENT_DBTYPES:
+        if hasattr(models, internal_type):
+            getattr(models, internal_type).register_lookup(AnyValueLookup)
     ArrayField.register_lookup(ContainedByLookup)
     ArrayField.register_lookup(ContainsLookup)
     ArrayField.register_lookup(OverlapLookup)
     ArrayField.register_lookup(ArrayLenTransform)
+    ArrayField.register_lookup(CardinalityTransform)
+    ArrayField.register_lookup(NdimsTransform)
+    ArrayField.register_lookup(DimsTransform)
     ArrayField.register_lookup(AnyStartswithLookup)
     ArrayField.register_lookup(AnyIStartswithLookup)
     ArrayField.register_lookup(AnyEndswithLookup)
@@ -388,36 +1041,151 @@ if django.VERSION[:2] >= (1, 7):
     ArrayField.register_lookup(AnyIContainsLookup)
 
 
-    class IndexTransform(Transform):
+    class IntarrayLookupMixin(object):
+        """
+        Fields declared with ``intarray=True`` use the operators of the
+        intarray extension, resolved by casting the right hand side to
+        int4[]. Other fields name the builtin operators explicitly, so
+        installing the extension does not change them: intarray operators
+        reject NULL elements and multidimensional arrays, and are not
+        served by array_ops GIN indexes.
+        """
+
+        def get_operator(self, connection):
+            operator = super(IntarrayLookupMixin, self).get_operator(connection)
+            if getattr(self.lhs.output_field, "_intarray", False):
+                return operator
+            return "OPERATOR(pg_catalog.%s)" % operator
+
+        def process_rhs(self, qn, connection):
+            rhs, rhs_params = super(IntarrayLookupMixin, self).process_rhs(qn, connection)
+            if self.rhs_is_direct_value():
+                field = self.lhs.output_field
+                dbtype = "int4[]" if getattr(field, "_intarray", False) else field.db_type(connection)
+                rhs = "%s::%s" % (rhs, dbtype)
+            return rhs, rhs_params
+
+    class IntarrayContainsLookup(IntarrayLookupMixin, ContainsLookup):
+        pass
+
+    class IntarrayContainedByLookup(IntarrayLookupMixin, ContainedByLookup):
+        pass
+
+    class IntarrayOverlapLookup(IntarrayLookupMixin, OverlapLookup):
+        pass
+
+    class IntarrayQueryLookup(Lookup):
+        """Matches the array against an intarray query, e.g. "1&(2|3)"."""
+        lookup_name = "query"
+
+        def as_sql(self, qn, connection):
+            lhs, lhs_params = self.process_lhs(qn, connection)
+            rhs, rhs_params = self.process_rhs(qn, connection)
+            params = lhs_params + rhs_params
+            return "%s @@ %s::query_int" % (lhs, rhs), params
+
+    class IntarrayCountTransform(Transform):
+        lookup_name = "icount"
+
+        @property
+        def output_field(self):
+            return models.IntegerField()
+
+        def as_sql(self, qn, connection):
+            lhs, params = qn.compile(self.lhs)
+            return "icount(%s)" % lhs, params
+
+    class IntarraySortTransform(Transform):
+        lookup_name = "sort"
+
+        def as_sql(self, qn, connection):
+            lhs, params = qn.compile(self.lhs)
+            return "sort(%s)" % lhs, params
+
+    class IntarrayUniqTransform(Transform):
+        lookup_name = "uniq"
+
+        def as_sql(self, qn, connection):
+            lhs, params = qn.compile(self.lhs)
+            return "uniq(%s)" % lhs, params
+
+    IntegerArrayField.register_lookup(IntarrayContainsLookup)
+    IntegerArrayField.register_lookup(IntarrayContainedByLookup)
+    IntegerArrayField.register_lookup(IntarrayOverlapLookup)
+    IntegerArrayField.register_lookup(IntarrayQueryLookup)
+    IntegerArrayField.register_lookup(IntarrayCountTransform)
+    IntegerArrayField.register_lookup(IntarraySortTransform)
+    IntegerArrayField.register_lookup(IntarrayUniqTransform)
+
+    class IntarrayFunctionTransform(ParametrizedTransformMixin, Transform):
+        def __init__(self, function, arguments, output_field, *args, **kwargs):
+            super(IntarrayFunctionTransform, self).__init__(*args, **kwargs)
+            self.function = function
+            self.arguments = arguments
+            if output_field is not None:
+                self.output_field = output_field
+
+        def as_sql(self, qn, connection):
+            lhs, params = qn.compile(self.lhs)
+            arguments = "".join(", %d" % arg for arg in self.arguments)
+            return "%s(%s%s)" % (self.function, lhs, arguments), params
+
+    class IndexTransform(ParametrizedTransformMixin, Transform):
+        """
+        Subscript of an array field (``field__0``). Chained subscripts of
+        multidimensional arrays (``field2__0__1``) are rendered together,
+        and the output field is the array of the remaining dimensions or
+        the element field.
+        """
+
         def __init__(self, index, field, *args, **kwargs):
             super(IndexTransform, self).__init__(*args, **kwargs)
             self.index = index
             self.field = field
 
+        def get_subscripts(self):
+            """Returns the subscripted expression, its field and the chained indexes."""
+            lhs, field, indexes = self.lhs, self.field, [self.index]
+            while isinstance(lhs, IndexTransform):
+                indexes.insert(0, lhs.index)
+                field = lhs.field
+                lhs = lhs.lhs
+            return lhs, field, indexes
+
+        @cached_property
+        def output_field(self):
+            lhs, field, indexes = self.get_subscripts()
+            return subscript_output_field(field, len(indexes))
+
         def as_sql(self, qn, connection):
-            lhs, params = qn.compile(self.lhs)
-            return "%s[%s]" % (lhs, self.index), params
-
-            # TODO: Temporary not supported nested index lookup
-            # @property
-            # def output_type(self):
-            # output_type = self.field.__class__(dimension=self.field._dimension-1)
-            # output_type._array_type = self.field._array_type
-            # output_type._explicit_type_cast = self.field._explicit_type_cast
-            # output_type._type_cast = self.field._type_cast
-            # output_type.set_attributes_from_name(self.field.name)
-            # return output_type
-
-    class SliceTransform(Transform):
-        def __init__(self, start, end, *args, **kwargs):
+            lhs, field, indexes = self.get_subscripts()
+            sql, params = qn.compile(lhs)
+            return subscript_sql(sql, indexes, field._dimension, isinstance(lhs, Transform)), params
+
+    class SliceTransform(ParametrizedTransformMixin, Transform):
+        def __init__(self, start, end, field, *args, **kwargs):
             super(SliceTransform, self).__init__(*args, **kwargs)
             self.start = start
             self.end = end
+            self.field = field
+
+        @property
+        def output_field(self):
+            return self.field
 
         def as_sql(self, qn, connection):
             lhs, params = qn.compile(self.lhs)
+            if isinstance(self.lhs, Transform):
+                lhs = "(%s)" % lhs
             return "%s[%s:%s]" % (lhs, self.start, self.end), params
 
+    class ArrayLenTransformFactory(object):
+        def __init__(self, dimension):
+            self.dimension = dimension
+
+        def __call__(self, *args, **kwargs):
+            return ArrayLenTransform(*args, dimension=self.dimension, **kwargs)
+
     class IndexTransformFactory(object):
         def __init__(self, index, field):
             self.index = index
@@ -426,13 +1194,24 @@ if django.VERSION[:2] >= (1, 7):
         def __call__(self, *args, **kwargs):
             return IndexTransform(self.index, self.field, *args, **kwargs)
 
+    class IntarrayFunctionTransformFactory(object):
+        def __init__(self, function, arguments, output_field=None):
+            self.function = function
+            self.arguments = arguments
+            self.output_field = output_field
+
+        def __call__(self, *args, **kwargs):
+            return IntarrayFunctionTransform(self.function, self.arguments, self.output_field,
+                                             *args, **kwargs)
+
     class SliceTransformFactory(object):
-        def __init__(self, start, end):
+        def __init__(self, start, end, field):
             self.start = start
             self.end = end
+            self.field = field
 
         def __call__(self, *args, **kwargs):
-            return SliceTransform(self.start, self.end, *args, **kwargs)
+            return SliceTransform(self.start, self.end, self.field, *args, **kwargs)
 
 
 # South support
@@ -447,6 +1226,11 @@ try:
                                         "dbtype": ["_array_type", {"default": "int"}],
                                         "dimension": ["_dimension", {"default": 1}],
                                         "null": ["null", {"default": True}],
+                                        "max_items": ["_max_items", {"default": None}],
+                                        "unique_items": ["_unique_items", {"default": False}],
+                                        "sorted_items": ["_sorted_items", {"default": False}],
+                                        "gin_index": ["_gin_index", {"default": False}],
+                                        "gin_opclass": ["_gin_opclass", {"default": None}],
                                     }
                                 )
                             ], ["^djorm_pgarray\.fields\.ArrayField"])
@@ -457,6 +1241,7 @@ try:
                                     {
                                         "dimension": ["_dimension", {"default": 1}],
                                         "null": ["null", {"default": True}],
+                                        "trigram_index": ["_trigram_index", {"default": False}],
                                     }
                                 )
                             ], ["^djorm_pgarray\.fields\.TextArrayField"])
@@ -477,6 +1262,7 @@ try:
                                     {
                                         "dimension": ["_dimension", {"default": 1}],
                                         "null": ["null", {"default": True}],
+                                        "intarray": ["_intarray", {"default": False}],
                                     }
                                 )
                             ], ["^djorm_pgarray\.fields\.IntegerArrayField"])
@@ -0,0 +1,269 @@
+# -*- coding: utf-8 -*-
+
+"""
+Migration operations for indexes that django can not express by itself
+for array fields. Add them by hand to a migration, after the operation
+that creates the field::
+
+    operations = [
+        ...
+        CreateTrigramIndex("Page", "tags"),
+    ]
+
+Only available for django >= 1.7.
+"""
+
+from __future__ import unicode_literals
+
+from django.db.backends.utils import truncate_name
+from django.db.models.constants import LOOKUP_SEP
+from django.db.migrations.operations.base import Operation
+
+from .fields import SORTED_FUNCTION, TRIGRAM_FUNCTION, UNIQUE_FUNCTION
+
+
+class ArrayIndexOperation(Operation):
+    """
+    Base operation that creates an index over one array field on forwards
+    and drops it on backwards. Subclasses build the CREATE statements.
+    """
+
+    reduces_to_sql = True
+    reversible = True
+    suffix = "_idx"
+    concurrently = False
+
+    def __init__(self, model_name, name, index_name=None):
+        self.model_name = model_name
+        self.name = name
+        self.index_name = index_name
+
+    def state_forwards(self, app_label, state):
+        pass
+
+    def get_index_name(self, schema_editor, model, field):
+        if self.index_name:
+            return self.index_name
+        name = "%s_%s%s" % (model._meta.db_table, field.column, self.suffix)
+        return truncate_name(name, schema_editor.connection.ops.max_name_length())
+
+    def get_field(self, model):
+        return model._meta.get_field_by_name(self.name)[0]
+
+    def create_sql(self, schema_editor, model, field):
+        raise NotImplementedError
+
+    def get_model(self, app_label, state):
+        # django 1.8 keeps the rendered models in state.apps, 1.7 renders them
+        apps = state.apps if hasattr(state, "apps") else state.render()
+        return apps.get_model(app_label, self.model_name)
+
+    def allow_migrate(self, connection_alias, model):
+        if hasattr(self, "allow_migrate_model"):
+            return self.allow_migrate_model(connection_alias, model)
+        return self.allowed_to_migrate(connection_alias, model)
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        model = self.get_model(app_label, to_state)
+        if self.allow_migrate(schema_editor.connection.alias, model):
+            field = self.get_field(model)
+            for sql in self.create_sql(schema_editor, model, field):
+                schema_editor.execute(sql, params=None)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        model = self.get_model(app_label, from_state)
+        if self.allow_migrate(schema_editor.connection.alias, model):
+            field = self.get_field(model)
+            index_name = self.get_index_name(schema_editor, model, field)
+            schema_editor.execute(self.drop_sql(schema_editor, index_name), params=None)
+
+    def drop_sql(self, schema_editor, index_name):
+        concurrently = "CONCURRENTLY " if self.concurrently else ""
+        return "DROP INDEX %sIF EXISTS %s" % (concurrently, schema_editor.quote_name(index_name))
+
+    def references_model(self, name, app_label=None):
+        return name.lower() == self.model_name.lower()
+
+    def references_field(self, model_name, name, app_label=None):
+        return self.references_model(model_name) and name.lower() == self.name.lower()
+
+
+class CreateGinIndex(ArrayIndexOperation):
+    """
+    Creates a GIN index over an array field, which serves the contains,
+    contained_by and overlap lookups. The operator class defaults to the
+    ``gin_opclass`` of the field (``array_ops`` when not set); intarray's
+    ``gin__int_ops`` can be used for integer arrays.
+
+    With ``concurrently=True`` the index is built without locking writes.
+    PostgreSQL does not allow it inside a transaction, so the migration
+    must not be atomic (``atomic = False``, django >= 1.8).
+    """
+
+    suffix = "_gin"
+    method = "gin"
+
+    def __init__(self, model_name, name, opclass=None, concurrently=False, index_name=None):
+        super(CreateGinIndex, self).__init__(model_name, name, index_name=index_name)
+        self.opclass = opclass
+        self.concurrently = concurrently
+
+    def get_opclass(self, field):
+        return self.opclass or getattr(field, "_gin_opclass", None)
+
+    def create_sql(self, schema_editor, model, field):
+        opclass = self.get_opclass(field)
+        return [
+            "CREATE INDEX {concurrently}{name} ON {table} USING {method} ({column}{opclass})".format(
+                concurrently="CONCURRENTLY " if self.concurrently else "",
+                method=self.method,
+                name=schema_editor.quote_name(self.get_index_name(schema_editor, model, field)),
+                table=schema_editor.quote_name(model._meta.db_table),
+                column=schema_editor.quote_name(field.column),
+                opclass=" %s" % opclass if opclass else ""),
+        ]
+
+    def describe(self):
+        return "Create GIN index on %s.%s" % (self.model_name, self.name)
+
+
+class CreateGistIndex(CreateGinIndex):
+    """
+    Creates a GiST index over an array field. Mostly useful with the
+    ``gist__int_ops`` and ``gist__intbig_ops`` operator classes of the
+    intarray extension, which also serve its ``@@`` query operator.
+    """
+
+    suffix = "_gist"
+    method = "gist"
+
+    def get_opclass(self, field):
+        return self.opclass
+
+    def describe(self):
+        return "Create GiST index on %s.%s" % (self.model_name, self.name)
+
+
+class CreateTrigramIndex(ArrayIndexOperation):
+    """
+    Creates a pg_trgm GIN index over the flattened contents of a text
+    array, used by the any_* lookups of fields declared with
+    ``TextArrayField(trigram_index=True)``. Installs the pg_trgm extension
+    and the flattening function if they are not present yet.
+    """
+
+    suffix = "_trgm"
+
+    def create_sql(self, schema_editor, model, field):
+        return [
+            "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+            "CREATE OR REPLACE FUNCTION {function}(text[]) RETURNS text "
+            "AS $$ SELECT array_to_string($1, E'\\x1f') $$ "
+            "LANGUAGE sql IMMUTABLE".format(function=TRIGRAM_FUNCTION),
+            "CREATE INDEX {name} ON {table} USING gin ({function}({column}) gin_trgm_ops)".format(
+                name=schema_editor.quote_name(self.get_index_name(schema_editor, model, field)),
+                table=schema_editor.quote_name(model._meta.db_table),
+                function=TRIGRAM_FUNCTION,
+                column=schema_editor.quote_name(field.column)),
+        ]
+
+    def describe(self):
+        return "Create trigram index on %s.%s" % (self.model_name, self.name)
+
+
+class CreateExpressionIndex(ArrayIndexOperation):
+    """
+    Creates a btree index over a transform of an array field, given as a
+    lookup path (``"tags__len"``, ``"tags__0"``, ``"matrix__0__1"``), so
+    filters on that transform can use it. The indexed expression is
+    compiled by the transform itself, so it is the same expression the
+    filters emit and the planner matches them.
+
+    Transforms that need a subquery (partial subscripts of
+    multidimensional arrays) can not be indexed.
+    """
+
+    suffix = "_expr"
+
+    def __init__(self, model_name, name, concurrently=False, index_name=None):
+        super(CreateExpressionIndex, self).__init__(model_name, name, index_name=index_name)
+        self.concurrently = concurrently
+
+    @property
+    def field_name(self):
+        return self.name.split(LOOKUP_SEP)[0]
+
+    def get_field(self, model):
+        return model._meta.get_field_by_name(self.field_name)[0]
+
+    def get_index_name(self, schema_editor, model, field):
+        if self.index_name:
+            return self.index_name
+        name = "%s_%s%s" % (model._meta.db_table, self.name.replace(LOOKUP_SEP, "_"), self.suffix)
+        return truncate_name(name, schema_editor.connection.ops.max_name_length())
+
+    def get_expression_sql(self, schema_editor, model):
+        queryset = model._default_manager.filter(**{self.name + LOOKUP_SEP + "isnull": False})
+        transform = queryset.query.where.children[0].lhs
+        compiler = queryset.query.get_compiler(connection=schema_editor.connection)
+        sql, params = compiler.compile(transform)
+        if params:
+            raise ValueError("Can not index %s: the expression has parameters." % self.name)
+        # Index expressions refer to the columns of the indexed table only
+        return sql.replace("%s." % schema_editor.quote_name(model._meta.db_table), "")
+
+    def create_sql(self, schema_editor, model, field):
+        return [
+            "CREATE INDEX {concurrently}{name} ON {table} (({expression}))".format(
+                concurrently="CONCURRENTLY " if self.concurrently else "",
+                name=schema_editor.quote_name(self.get_index_name(schema_editor, model, field)),
+                table=schema_editor.quote_name(model._meta.db_table),
+                expression=self.get_expression_sql(schema_editor, model)),
+        ]
+
+    def references_field(self, model_name, name, app_label=None):
+        return self.references_model(model_name) and name.lower() == self.field_name.lower()
+
+    def describe(self):
+        return "Create expression index on %s.%s" % (self.model_name, self.name)
+
+
+class CreateArrayCheckFunctions(Operation):
+    """
+    Installs the immutable functions called by the CHECK constraints of
+    fields declared with ``unique_items=True`` or ``sorted_items=True``.
+    Add it before the operation that creates the field, since the
+    constraint is part of the column definition. The order check sorts in
+    the collation of its argument, so the constraints of text arrays pass
+    it with ``COLLATE "C"`` to get a result that does not depend on the
+    database collation::
+
+        operations = [
+            CreateArrayCheckFunctions(),
+            migrations.CreateModel(...),
+        ]
+    """
+
+    reduces_to_sql = True
+    reversible = True
+
+    def state_forwards(self, app_label, state):
+        pass
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        schema_editor.execute(
+            "CREATE OR REPLACE FUNCTION {function}(anyarray) RETURNS boolean "
+            "AS $$ SELECT count(DISTINCT x) = count(x) FROM unnest($1) AS t(x) $$ "
+            "LANGUAGE sql IMMUTABLE".format(function=UNIQUE_FUNCTION))
+        schema_editor.execute(
+            "CREATE OR REPLACE FUNCTION {function}(anyarray) RETURNS boolean "
+            "AS $$ SELECT ARRAY(SELECT x FROM unnest($1) AS t(x) WHERE x IS NOT NULL) = "
+            "ARRAY(SELECT x FROM unnest($1) AS t(x) WHERE x IS NOT NULL ORDER BY x) $$ "
+            "LANGUAGE sql IMMUTABLE".format(function=SORTED_FUNCTION))
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        for function in (UNIQUE_FUNCTION, SORTED_FUNCTION):
+            schema_editor.execute("DROP FUNCTION IF EXISTS {function}(anyarray)".format(function=function))
+
+    def describe(self):
+        return "Create array check functions"
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+
+"""
+Parser for the postgres array text format (``{a,"b c",NULL,{1,2}}``).
+
+``parse_array`` uses the C array parser of psycopg2 when it can be called
+outside of a cursor (psycopg2 >= 2.9 on python 3), and falls back to the
+pure python implementation otherwise. The C parser is meant for values
+produced by postgres: it keeps the whitespace around unquoted elements
+and reads missing elements as empty strings, so literals padded with
+whitespace (``{ a , b }``) or with empty elements (``{a,,b}``) are left to
+the python implementation, which strips the first and rejects the second
+like postgres does.
+"""
+
+from __future__ import unicode_literals
+
+import re
+
+from django.utils import six
+
+_DIMENSIONS_RE = re.compile(r"^(?:\[-?\d+:-?\d+\])+=")
+_TOKEN_RE = re.compile(r'"((?:[^"\\]|\\.)*)"|([{},])|([^{},"]+)', re.S)
+_UNESCAPE_RE = re.compile(r"\\(.)", re.S)
+_LENIENT_RE = re.compile(r"[{,]\s|\s[,}]|[{,],|,}")
+
+
+def is_array_literal(text):
+    """Tells whether text looks like an array literal (and not json)."""
+    return text.startswith("{") or _DIMENSIONS_RE.match(text) is not None
+
+
+def _malformed(text):
+    return ValueError("Malformed array literal: %r" % text)
+
+
+def parse_array_python(text):
+    """
+    Parses the text representation of a postgres array into nested
+    lists of strings, with None for NULL elements. An explicit
+    dimensions decoration (``[0:1]={...}``) is ignored.
+    """
+    match = _DIMENSIONS_RE.match(text)
+    if match is not None:
+        text = text[match.end():]
+    if not text.startswith("{") or not text.endswith("}"):
+        raise _malformed(text)
+
+    body = text[1:-1]
+    # Fast path: flat arrays without quoted elements, e.g. numbers
+    if '"' not in body and "{" not in body and "}" not in body:
+        if not body.strip():
+            return []
+        values = [x.strip() for x in body.split(",")] if " " in body else body.split(",")
+        if "" in values:
+            raise _malformed(text)
+        if "NULL" in values or "null" in body.lower():
+            values = [None if x.upper() == "NULL" else x for x in values]
+        return values
+
+    stack = []
+    current = None
+    expect_value = True
+    pos = 0
+    for match in _TOKEN_RE.finditer(text):
+        if match.start() != pos:
+            raise _malformed(text)
+        pos = match.end()
+        quoted, punct, bare = match.groups()
+        if punct == "{":
+            if current is not None:
+                current.append([])
+                stack.append(current)
+                current = current[-1]
+            elif stack:
+                raise _malformed(text)
+            else:
+                current = []
+                stack.append(None)
+            expect_value = True
+        elif punct == "}":
+            if current is None or (expect_value and current):
+                raise _malformed(text)
+            parent = stack.pop()
+            if parent is None:
+                result = current
+                current = None
+                if match.end() != len(text):
+                    raise _malformed(text)
+            else:
+                current = parent
+            expect_value = False
+        elif punct == ",":
+            if expect_value:
+                raise _malformed(text)
+            expect_value = True
+        elif current is None or not expect_value:
+            if bare is None or bare.strip():
+                raise _malformed(text)
+        elif quoted is not None:
+            current.append(_UNESCAPE_RE.sub(r"\1", quoted) if "\\" in quoted else quoted)
+            expect_value = False
+        else:
+            value = bare.strip()
+            if not value:
+                continue
+            current.append(None if value.upper() == "NULL" else value)
+            expect_value = False
+
+    if current is not None or stack or pos != len(text):
+        raise _malformed(text)
+    return result
+
+
+def _load_psycopg2_parser():
+    try:
+        import psycopg2
+        from psycopg2.extensions import UNICODEARRAY
+    except ImportError:
+        return None
+
+    version = tuple(int(x) for x in re.findall(r"\d+", psycopg2.__version__)[:2])
+    if not six.PY3 or version < (2, 9):
+        return None
+
+    def parse_array_c(text):
+        match = _DIMENSIONS_RE.match(text)
+        if match is not None:
+            text = text[match.end():]
+        if not text.startswith("{") or not text.endswith("}"):
+            raise _malformed(text)
+        if _LENIENT_RE.search(text) is not None:
+            return parse_array_python(text)
+        try:
+            return UNICODEARRAY(text, None)
+        except psycopg2.DataError:
+            raise _malformed(text)
+
+    return parse_array_c
+
+
+parse_array = _load_psycopg2_parser() or parse_array_python
@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+
+"""
+Arrays of primary keys used in place of many to many join tables, with
+the related objects loaded in one query per queryset by prefetch_related.
+"""
+
+from __future__ import unicode_literals
+
+import operator
+
+import django
+from django.db import connections
+from django.db.models.fields.related import add_lazy_relation
+from django.utils import six
+
+from .fields import ArrayField
+
+
+def _filter_ids(queryset, field, ids):
+    """
+    Filters a queryset of the related model on the given primary keys,
+    bound as one array parameter (``pk = ANY(%s::int[])``) rather than
+    one parameter per key.
+    """
+    if django.VERSION[:2] >= (1, 7):
+        return queryset.filter(pk__any=list(ids))
+    # django < 1.7 has no custom lookups
+    connection = connections[queryset.db]
+    opts = queryset.model._meta
+    where = "%s.%s = ANY(%%s::%s)" % (connection.ops.quote_name(opts.db_table),
+                                       connection.ops.quote_name(opts.pk.column),
+                                       field.db_type(connection))
+    return queryset.extra(where=[where], params=[field.get_db_prep_value(list(ids), connection)])
+
+
+class RelatedList(list):
+    """
+    Related objects of an ArrayForeignKey, in the order of the keys. Keys
+    without a row are skipped.
+    """
+
+    def __init__(self, ids, objects):
+        super(RelatedList, self).__init__(objects[pk] for pk in ids if pk in objects)
+        self.ids = ids
+
+
+class ArrayForeignKeyDescriptor(object):
+    """
+    Attribute descriptor returning the related objects of an
+    ArrayForeignKey as a RelatedList. The list is cached on the instance
+    until the keys change, and is filled for a whole queryset at once by
+    ``prefetch_related(<accessor>)``.
+    """
+
+    def __init__(self, field):
+        self.field = field
+        self.cache_name = "_%s_cache" % field.accessor
+
+    def _get_ids(self, instance):
+        return tuple(getattr(instance, self.field.attname) or ())
+
+    def _fetch(self, queryset, ids):
+        if not ids:
+            return {}
+        return dict((obj.pk, obj) for obj in _filter_ids(queryset, self.field, ids))
+
+    def is_cached(self, instance):
+        cached = getattr(instance, self.cache_name, None)
+        return cached is not None and cached.ids == self._get_ids(instance)
+
+    def get_queryset(self, **hints):
+        return self.field.to._default_manager.all()
+
+    def get_prefetch_queryset(self, instances, queryset=None):
+        if queryset is None:
+            queryset = self.get_queryset().using(instances[0]._state.db or "default")
+        keys = set(self._get_ids(instance) for instance in instances)
+        objects = self._fetch(queryset, set(pk for key in keys for pk in key))
+        # One list per distinct array of keys, matched back to the
+        # instances by the keys themselves
+        related = [RelatedList(key, objects) for key in keys]
+        return related, operator.attrgetter("ids"), self._get_ids, True, self.cache_name
+
+    # django < 1.7
+    def get_prefetch_query_set(self, instances):
+        return self.get_prefetch_queryset(instances)
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        if not self.is_cached(instance):
+            ids = self._get_ids(instance)
+            queryset = self.get_queryset().using(instance._state.db or "default")
+            setattr(instance, self.cache_name, RelatedList(ids, self._fetch(queryset, ids)))
+        return getattr(instance, self.cache_name)
+
+    def __set__(self, instance, value):
+        value = list(value or ())
+        ids = tuple(getattr(obj, "pk", obj) for obj in value)
+        setattr(instance, self.field.attname, list(ids))
+        if all(isinstance(obj, self.field.to) for obj in value):
+            setattr(instance, self.cache_name, RelatedList(ids, dict(zip(ids, value))))
+
+
+class ArrayForeignKey(ArrayField):
+    """
+    One dimension array of primary keys of another model, given as a model
+    class or as ``"app_label.ModelName"``. The field holds the keys, and
+    the ``accessor`` attribute (``<name>_objects`` by default) returns the
+    related objects in the order of the keys::
+
+        class Book(models.Model):
+            author_ids = ArrayForeignKey(Author, accessor="authors")
+
+        for book in Book.objects.prefetch_related("authors"):
+            print(book.authors)
+
+    No constraint checks that the keys exist, and deleting related objects
+    does not update the arrays. Use ``gin_index=True`` and CreateGinIndex
+    for reverse lookups (``Book.objects.filter(author_ids__contains=[pk])``).
+    """
+
+    def __init__(self, to, dbtype="int", *args, **kwargs):
+        self.to = to
+        self._accessor = kwargs.pop("accessor", None)
+        super(ArrayForeignKey, self).__init__(dbtype, *args, **kwargs)
+
+    @property
+    def accessor(self):
+        return self._accessor or "%s_objects" % self.name
+
+    @property
+    def to_label(self):
+        if isinstance(self.to, six.string_types):
+            return self.to
+        return "%s.%s" % (self.to._meta.app_label, self.to._meta.object_name)
+
+    def contribute_to_class(self, cls, name, **kwargs):
+        super(ArrayForeignKey, self).contribute_to_class(cls, name, **kwargs)
+        setattr(cls, self.accessor, ArrayForeignKeyDescriptor(self))
+        if isinstance(self.to, six.string_types):
+            def resolve_related_class(field, model, cls):
+                field.to = model
+            add_lazy_relation(cls, self, self.to, resolve_related_class)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super(ArrayForeignKey, self).deconstruct()
+        kwargs["to"] = self.to_label
+        if self._accessor is not None:
+            kwargs["accessor"] = self._accessor
+        return name, path, args, kwargs
+
+
+# South support
+try:
+    from south.modelsinspector import add_introspection_rules
+
+    add_introspection_rules([
+                                (
+                                    [ArrayForeignKey],  # class
+                                    [],  # positional params
+                                    {
+                                        "to": ["to_label", {}],
+                                        "accessor": ["_accessor", {"default": None}],
+                                    }
+                                )
+                            ], ["^djorm_pgarray\.related\.ArrayForeignKey"])
+except ImportError:
+    pass
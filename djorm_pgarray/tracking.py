@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+
+"""
+Change tracking for array fields, so saving a loaded instance does not
+rewrite arrays that were not modified.
+"""
+
+from __future__ import unicode_literals
+
+import django
+from django.db.models.query_utils import DeferredAttribute
+from django.db.models.signals import class_prepared
+from django.utils import six
+
+from .fields import ArrayField, ArrayFieldDescriptor, SNAPSHOTS_ATTRIBUTE
+
+# Element types array_remove() deltas are written for; other values are
+# not adapted to the element type by psycopg2 without a cast.
+_REMOVABLE_TYPES = six.string_types + six.integer_types + (float,)
+
+
+def get_delta_expression(field, old, new):
+    """
+    Returns an update expression turning the loaded value ``old`` of a one
+    dimension array field into ``new`` when the change is a pure append
+    (``col || %s``) or a removal of every occurrence of some values
+    (``array_remove(col, %s)``), or None when the whole array has to be
+    written.
+    """
+    if django.VERSION[:2] < (1, 8) or field._dimension != 1:
+        return None
+    if not isinstance(old, tuple) or not isinstance(new, list) or not old:
+        return None
+    from django.db.models import F
+    from .expressions import ArrayCat, ArrayRemove, ArrayValue
+
+    if len(new) > len(old):
+        if tuple(new[:len(old)]) == old:
+            return ArrayCat(F(field.name), ArrayValue(new[len(old):], field))
+        return None
+    try:
+        removed = set(old).difference(new)
+    except TypeError:
+        return None
+    if not removed or not all(isinstance(x, _REMOVABLE_TYPES) for x in removed):
+        return None
+    if [x for x in old if x not in removed] != new:
+        return None
+    expression = F(field.name)
+    for value in sorted(removed, key=old.index):
+        expression = ArrayRemove(expression, value)
+    return expression
+
+
+class TrackedDeferredAttribute(DeferredAttribute):
+    """
+    Deferred array attribute of tracked models, which takes the value
+    loaded on first access as the loaded value of the field.
+    """
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        loaded = self.field_name in instance.__dict__
+        value = super(TrackedDeferredAttribute, self).__get__(instance, owner)
+        if not loaded:
+            field = [f for f in instance._meta.concrete_fields if f.attname == self.field_name][0]
+            ArrayFieldDescriptor(field).snapshot(instance, value)
+        return value
+
+
+def _track_deferred_arrays(sender, **kwargs):
+    """Installs TrackedDeferredAttribute on the deferred classes of tracked models."""
+    if not getattr(sender, "_deferred", False) or not getattr(sender, "track_array_changes", False):
+        return
+    for field in sender._meta.concrete_fields:
+        attribute = sender.__dict__.get(field.attname)
+        if isinstance(field, ArrayField) and type(attribute) is DeferredAttribute:
+            setattr(sender, field.attname, TrackedDeferredAttribute(field.attname, sender))
+
+
+class_prepared.connect(_track_deferred_arrays)
+
+
+class ArrayTrackingMixin(object):
+    """
+    Model mixin remembering the loaded value of array fields. save() on
+    loaded instances leaves the array fields that did not change out of
+    the UPDATE (django >= 1.6), unless ``update_fields`` is given. Arrays
+    only appended to, or with values removed, are updated with the
+    difference (see get_delta_expression)::
+
+        class Document(ArrayTrackingMixin, models.Model):
+            tags = TextArrayField()
+    """
+
+    track_array_changes = True
+
+    def _array_fields(self):
+        return [f for f in self._meta.concrete_fields if isinstance(f, ArrayField)]
+
+    def has_changed(self, field_name):
+        """Tells whether the given array field differs from the loaded value."""
+        field = self._meta.get_field(field_name)
+        return field.has_changed(self)
+
+    def get_changed_array_fields(self):
+        """Returns the names of the array fields that differ from the loaded value."""
+        return [f.name for f in self._array_fields() if f.has_changed(self)]
+
+    def refresh_from_db(self, using=None, fields=None, **kwargs):
+        super(ArrayTrackingMixin, self).refresh_from_db(using=using, fields=fields, **kwargs)
+        # Refreshed values are the new loaded values
+        for field in self._array_fields():
+            if fields is not None and field.name not in fields and field.attname not in fields:
+                continue
+            if field.attname in self.__dict__:
+                ArrayFieldDescriptor(field).snapshot(self, getattr(self, field.attname))
+
+    def _do_update(self, base_qs, using, pk_val, values, update_fields, forced_update):
+        # Only the UPDATE leaves unchanged arrays out and writes the deltas
+        # of changed ones: when it matches no row, django still falls back
+        # to an INSERT of every field, with their values.
+        if update_fields is None and not self._state.adding:
+            snapshots = self.__dict__.get(SNAPSHOTS_ATTRIBUTE, {})
+            update_values = []
+            for field, model, value in values:
+                if isinstance(field, ArrayField):
+                    if not field.has_changed(self):
+                        continue
+                    if field.name in snapshots:
+                        expression = get_delta_expression(field, snapshots[field.name],
+                                                          field.get_prep_value(value))
+                        if expression is not None:
+                            value = expression
+                update_values.append((field, model, value))
+            values = update_values
+        return super(ArrayTrackingMixin, self)._do_update(base_qs, using, pk_val, values,
+                                                          update_fields, forced_update)
+
+    def save(self, *args, **kwargs):
+        super(ArrayTrackingMixin, self).save(*args, **kwargs)
+
+        # What was saved is the new loaded value
+        for field in self._array_fields():
+            if field.has_changed(self):
+                ArrayFieldDescriptor(field).snapshot(self, getattr(self, field.name))
@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+import djorm_pgarray.fields
+import djorm_pgarray.operations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pg_array_fields', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrigramModel',
+            fields=[
+                ('id', models.AutoField(auto_created=True, serialize=False, primary_key=True, verbose_name='ID')),
+                ('tags', djorm_pgarray.fields.TextArrayField(dbtype='text', trigram_index=True)),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+        djorm_pgarray.operations.CreateTrigramIndex('TrigramModel', 'tags'),
+    ]
@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+import djorm_pgarray.fields
+import djorm_pgarray.operations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pg_array_fields', '0002_trigrammodel'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GinModel',
+            fields=[
+                ('id', models.AutoField(auto_created=True, serialize=False, primary_key=True, verbose_name='ID')),
+                ('ints', djorm_pgarray.fields.IntegerArrayField(gin_index=True)),
+                ('tags', djorm_pgarray.fields.TextArrayField(dbtype='text', gin_index=True, gin_opclass='array_ops')),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+        djorm_pgarray.operations.CreateGinIndex('GinModel', 'ints'),
+        djorm_pgarray.operations.CreateGinIndex('GinModel', 'tags'),
+    ]
@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+import djorm_pgarray.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pg_array_fields', '0004_intarray'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NumpyModel',
+            fields=[
+                ('id', models.AutoField(auto_created=True, serialize=False, primary_key=True, verbose_name='ID')),
+                ('vector', djorm_pgarray.fields.FloatArrayField(dbtype='double precision', as_numpy=True, dtype='float32')),
+                ('matrix', djorm_pgarray.fields.IntegerArrayField(dimension=2, as_numpy=True)),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+import djorm_pgarray.fields
+import djorm_pgarray.tracking
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pg_array_fields', '0005_numpymodel'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrackedModel',
+            fields=[
+                ('id', models.AutoField(auto_created=True, serialize=False, primary_key=True, verbose_name='ID')),
+                ('name', models.CharField(default='', max_length=32)),
+                ('tags', djorm_pgarray.fields.TextArrayField(dbtype='text')),
+                ('values', djorm_pgarray.fields.IntegerArrayField()),
+            ],
+            options={
+            },
+            bases=(djorm_pgarray.tracking.ArrayTrackingMixin, models.Model),
+        ),
+    ]
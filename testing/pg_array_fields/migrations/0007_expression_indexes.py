@@ -0,0 +1,17 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+import djorm_pgarray.operations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pg_array_fields', '0006_trackedmodel'),
+    ]
+
+    operations = [
+        djorm_pgarray.operations.CreateExpressionIndex('IntModel', 'field__len'),
+        djorm_pgarray.operations.CreateExpressionIndex('TextModel', 'field__0'),
+    ]
@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+import djorm_pgarray.fields
+import djorm_pgarray.operations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pg_array_fields', '0007_expression_indexes'),
+    ]
+
+    operations = [
+        djorm_pgarray.operations.CreateArrayCheckFunctions(),
+        migrations.CreateModel(
+            name='ConstrainedModel',
+            fields=[
+                ('id', models.AutoField(auto_created=True, serialize=False, primary_key=True, verbose_name='ID')),
+                ('tags', djorm_pgarray.fields.TextArrayField(dbtype='text', max_items=3, unique_items=True, sorted_items=True)),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+    ]
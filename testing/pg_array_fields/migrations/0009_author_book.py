@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+import djorm_pgarray.operations
+import djorm_pgarray.related
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pg_array_fields', '0008_constrainedmodel'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Author',
+            fields=[
+                ('id', models.AutoField(auto_created=True, serialize=False, primary_key=True, verbose_name='ID')),
+                ('name', models.CharField(max_length=32)),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+        migrations.CreateModel(
+            name='Book',
+            fields=[
+                ('id', models.AutoField(auto_created=True, serialize=False, primary_key=True, verbose_name='ID')),
+                ('author_ids', djorm_pgarray.related.ArrayForeignKey(to='pg_array_fields.Author', accessor='authors', gin_index=True)),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+        djorm_pgarray.operations.CreateGinIndex('Book', 'author_ids'),
+    ]
@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+import djorm_pgarray.fields
+import djorm_pgarray.operations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pg_array_fields', '0009_author_book'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IntarrayModel',
+            fields=[
+                ('id', models.AutoField(auto_created=True, serialize=False, primary_key=True, verbose_name='ID')),
+                ('values', djorm_pgarray.fields.IntegerArrayField(intarray=True, gin_index=True, gin_opclass='gin__int_ops')),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+        djorm_pgarray.operations.CreateGinIndex('IntarrayModel', 'values'),
+    ]
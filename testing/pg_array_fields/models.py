@@ -8,6 +8,8 @@ from djorm_pgarray.fields import IntegerArrayField
 from djorm_pgarray.fields import DateArrayField
 from djorm_pgarray.fields import DateTimeArrayField
 from djorm_pgarray.fields import SmallIntegerArrayField
+from djorm_pgarray.related import ArrayForeignKey
+from djorm_pgarray.tracking import ArrayTrackingMixin
 
 def defaultval(*args, **kwargs):
     return []
@@ -58,22 +60,41 @@ class ChoicesModel(models.Model):
     choices = TextArrayField(choices=[("A", "A"), ("B", "B")])
 
 
+class BytesArrayModel(models.Model):
+    entries = ArrayField(dbtype="bytea")
 
-# This is need if you want compatibility with both, python2
-# and python3. If you do not need one of them, simple remove
-# the appropiate conditional branch
-# TODO: at this momment not used
 
-def _memoryview_to_bytes(value):
-    if isinstance(value, memoryview):
-       return value.tobytes()
+class TrigramModel(models.Model):
+    tags = TextArrayField(trigram_index=True)
 
-    if sys.version_info.major == 2:
-       if isinstance(value, buffer):
-           return str(buffer)
 
-    return value
+class GinModel(models.Model):
+    ints = IntegerArrayField(gin_index=True)
+    tags = TextArrayField(gin_index=True, gin_opclass="array_ops")
 
 
-class BytesArrayModel(models.Model):
-    entries = ArrayField(dbtype="bytea")
+class NumpyModel(models.Model):
+    vector = FloatArrayField(as_numpy=True, dtype="float32")
+    matrix = IntegerArrayField(as_numpy=True, dimension=2)
+
+
+class TrackedModel(ArrayTrackingMixin, models.Model):
+    name = models.CharField(max_length=32, default="")
+    tags = TextArrayField()
+    values = IntegerArrayField()
+
+
+class ConstrainedModel(models.Model):
+    tags = TextArrayField(max_items=3, unique_items=True, sorted_items=True)
+
+
+class Author(models.Model):
+    name = models.CharField(max_length=32)
+
+
+class Book(models.Model):
+    author_ids = ArrayForeignKey(Author, accessor="authors", gin_index=True)
+
+
+class IntarrayModel(models.Model):
+    values = IntegerArrayField(intarray=True, gin_index=True, gin_opclass="gin__int_ops")
@@ -3,19 +3,31 @@
 
 import unittest
 import datetime
+import decimal
+import pickle
+import uuid
 from django.contrib.admin import AdminSite
 from django.contrib.admin import ModelAdmin
+from django.core.exceptions import FieldError, ImproperlyConfigured, ValidationError
 from django.core.serializers import serialize
 from django.core.serializers import deserialize
-from django.db import connection
+from django.db import connection, transaction, IntegrityError
 from django.test import TestCase
 from django.utils.encoding import force_text
 from django.utils import six
 from django import forms
 import django
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 from djorm_pgarray.fields import ArrayField
 from djorm_pgarray.fields import ArrayFormField
+from djorm_pgarray.fields import IntegerArrayField
+from djorm_pgarray.fields import subscript_output_field
+from djorm_pgarray.fields import subscript_sql
 from .forms import IntArrayForm
 from .models import IntModel
 from .models import TextModel
@@ -29,6 +41,14 @@ from .models import DateModel
 from .models import DateTimeModel
 from .models import MacAddrModel
 from .models import BytesArrayModel
+from .models import TrigramModel
+from .models import GinModel
+from .models import NumpyModel
+from .models import TrackedModel
+from .models import ConstrainedModel
+from .models import Author
+from .models import Book
+from .models import IntarrayModel
 
 
 # Adapters
@@ -51,6 +71,18 @@ def get_type_oid(sql_expression):
         cursor.close()
 
 
+def explain(queryset):
+    """Return the plan of queryset, with sequential scans discouraged."""
+    sql, params = queryset.query.sql_with_params()
+    cursor = connection.cursor()
+    try:
+        cursor.execute("SET LOCAL enable_seqscan = off")
+        cursor.execute("EXPLAIN " + sql, params)
+        return "\n".join(row[0] for row in cursor.fetchall())
+    finally:
+        cursor.close()
+
+
 def cast_macaddr(val, cur):
     return MacAddr(val)
 
@@ -231,11 +263,232 @@ class ArrayFieldTests(TestCase):
         self.assertEqual(memoryview(obj2.entries[1]).tobytes(), data[1].tobytes())
         self.assertEqual(memoryview(obj2.entries[2]).tobytes(), data[2].tobytes())
 
+    def test_to_python_does_not_copy_native_lists(self):
+        value = [1, 2, 3]
+        self.assertIs(ArrayField(dbtype="int").to_python(value), value)
+        self.assertEqual(ArrayField(dbtype="int").to_python((1, 2)), [1, 2])
+        self.assertEqual(ArrayField(dbtype="int").to_python("[1, 2]"), [1, 2])
+
+        value = [u"a", u"ñ"]
+        self.assertEqual(ArrayField(dbtype="text").to_python(value), value)
+        if six.PY3:
+            self.assertIs(ArrayField(dbtype="text").to_python(value), value)
+
+    def test_get_db_prep_value_casts(self):
+        field = ArrayField(dbtype="int")
+        value = [1, 2, 3]
+        self.assertIs(field.get_db_prep_value(value, connection), value)
+        self.assertEqual(field.get_db_prep_value(["1", 2.0], connection), [1, 2])
+        self.assertEqual(field.get_db_prep_value([[1, "2"], ["3", 4]], connection), [[1, 2], [3, 4]])
+
+        field = ArrayField(dbtype="text", dimension=2)
+        self.assertEqual(field.get_db_prep_value([[1, u"ñ"]], connection), [[u"1", u"ñ"]])
+
+    def test_numeric_arrays_saved_as_literals(self):
+        field = IntModel._meta.get_field_by_name('field2')[0]
+        value = field.get_db_prep_save([[1, None], [3, 4]], connection)
+        self.assertEqual(value.getquoted(), b"'{{1,NULL},{3,4}}'::int[][]")
+
+        obj = DoubleModel.objects.create(field=[0.1, 1e300, None])
+        obj = DoubleModel.objects.get(pk=obj.pk)
+        self.assertEqual(obj.field, [0.1, 1e300, None])
+
+        obj = IntModel.objects.create(field=[], field2=[[1, None], [3, 4]])
+        obj = IntModel.objects.get(pk=obj.pk)
+        self.assertEqual(obj.field, [])
+        self.assertEqual(obj.field2, [[1, None], [3, 4]])
+
+    def test_parse_array_literals(self):
+        from djorm_pgarray.parser import parse_array, parse_array_python, _load_psycopg2_parser
+
+        parsers = [parse_array, parse_array_python, _load_psycopg2_parser()]
+        for parse in filter(None, parsers):
+            self.assertEqual(parse(u'{}'), [])
+            self.assertEqual(parse(u'{1,NULL,3}'), [u'1', None, u'3'])
+            self.assertEqual(parse(u'{a,"b c","NULL","",NULL}'), [u'a', u'b c', u'NULL', u'', None])
+            self.assertEqual(parse(u'{"a\\"b","c\\\\d","{x,y}"}'), [u'a"b', u'c\\d', u'{x,y}'])
+            self.assertEqual(parse(u'{{1,2},{3,NULL}}'), [[u'1', u'2'], [u'3', None]])
+            self.assertEqual(parse(u'[0:1]={1,2}'), [u'1', u'2'])
+            self.assertEqual(parse(u'{ a , b }'), [u'a', u'b'])
+            self.assertEqual(parse(u'{{ a ,NULL }, {"b ", c}}'), [[u'a', None], [u'b ', u'c']])
+            self.assertEqual(parse(u'{ }'), [])
+
+            for value in (u'{a,,b}', u'{a,}', u'{,a}', u'{a, ,b}', u'{{a},,{b}}', u'{{a,},{b}}'):
+                self.assertRaises(ValueError, parse, value)
+
+        for value in (u'{1,2', u'{"a}', u'{1}x', u'{{1}'):
+            self.assertRaises(ValueError, parse_array_python, value)
+
+    def test_to_python_parses_array_literals(self):
+        self.assertEqual(ArrayField(dbtype="int").to_python(u'{1,2,NULL}'), [1, 2, None])
+        self.assertEqual(ArrayField(dbtype="text", dimension=2).to_python(u'{{a,"b c"}}'), [[u'a', u'b c']])
+        self.assertEqual(ArrayField(dbtype="int").to_python(u'[1, 2]'), [1, 2])
+
+        cursor = connection.cursor()
+        cursor.execute("SELECT '{00:24:d6:54:ff:c6}'::macaddr[]::text")
+        value = cursor.fetchone()[0]
+        self.assertEqual(ArrayField(dbtype="macaddr").to_python(value), [u'00:24:d6:54:ff:c6'])
+
+    def test_element_type_registry(self):
+        from djorm_pgarray.casts import get_type, normalize_type
+
+        self.assertEqual(normalize_type("Numeric(10, 2)"), "numeric")
+        self.assertEqual(normalize_type("timestamp(3)  with time zone"), "timestamp with time zone")
+        self.assertIs(get_type("varchar(30)"), get_type("text"))
+        self.assertIsNone(get_type("hstore"))
+
+        field = ArrayField(dbtype="numeric(10,2)")
+        self.assertEqual(field.get_db_prep_value(["1.50", 2], connection),
+                         [decimal.Decimal("1.50"), decimal.Decimal(2)])
+
+        values = [uuid.uuid4(), None]
+        field = ArrayField(dbtype="uuid")
+        cursor = connection.cursor()
+        cursor.execute("SELECT %s", [field.get_db_prep_save([force_text(values[0]), None], connection)])
+        self.assertEqual(field.to_python(cursor.fetchone()[0]), values)
+
+        field = ArrayField(dbtype="bytea")
+        cursor.execute("SELECT %s", [field.get_db_prep_save([b'\x01\\"', memoryview(b'\x02')], connection)])
+        self.assertEqual(field.to_python(cursor.fetchone()[0]), [b'\x01\\"', b'\x02'])
+        self.assertEqual(field.to_python(u'{"\\\\x0102"}'), [b'\x01\x02'])
+
+    def test_element_casts_reject_invalid_values(self):
+        field = ArrayField(dbtype="date")
+        self.assertEqual(field.get_db_prep_value(["2014-01-02"], connection), [datetime.date(2014, 1, 2)])
+        self.assertRaises(ValueError, field.get_db_prep_value, ["garbage"], connection)
+        self.assertRaises(ValueError, ArrayField(dbtype="timestamp").get_db_prep_value, ["2014-01-02"], connection)
+
+        field = ArrayField(dbtype="boolean")
+        self.assertEqual(field.get_db_prep_value(["t", "FALSE", "yes", "0"], connection), [True, False, True, False])
+        self.assertRaises(ValueError, field.get_db_prep_value, ["garbage"], connection)
+
+        form_field = DateModel._meta.get_field_by_name('dates')[0].formfield()
+        self.assertEqual(form_field.clean(u'2014-01-02'), [datetime.date(2014, 1, 2)])
+        self.assertRaisesMessage(forms.ValidationError, 'Enter valid values: foo.',
+                                 form_field.clean, u'2014-01-02,foo')
+
+    def test_lazy_conversion_on_access(self):
+        obj = IntModel(field=(1, 2))
+        self.assertEqual(obj.field, [1, 2])
+        self.assertIs(obj.field, obj.field)
+
+        obj.field.append(3)
+        obj.save()
+        obj = IntModel.objects.get(pk=obj.pk)
+        self.assertEqual(obj.field, [1, 2, 3])
+
+        obj = pickle.loads(pickle.dumps(IntModel.objects.get(pk=obj.pk)))
+        self.assertEqual(obj.field, [1, 2, 3])
+
+    @unittest.skipIf(numpy is None, "numpy is not installed")
+    def test_numpy_arrays(self):
+        vector = numpy.array([1.5, 2.5, 3.5])
+        matrix = numpy.arange(6).reshape(2, 3)
+        obj = NumpyModel.objects.create(vector=vector, matrix=matrix)
+
+        obj = NumpyModel.objects.get(pk=obj.pk)
+        self.assertIsInstance(obj.vector, numpy.ndarray)
+        self.assertEqual(obj.vector.dtype, numpy.float32)
+        self.assertEqual(obj.vector.tolist(), [1.5, 2.5, 3.5])
+        self.assertEqual(obj.matrix.shape, (2, 3))
+        self.assertEqual(obj.matrix.tolist(), [[0, 1, 2], [3, 4, 5]])
+
+        obj = NumpyModel.objects.create(vector=[], matrix=[])
+        obj = NumpyModel.objects.get(pk=obj.pk)
+        self.assertEqual(obj.vector.shape, (0,))
+        self.assertEqual(obj.matrix.ndim, 2)
+
+    def test_loaded_values_are_converted_once(self):
+        obj = DateModel.objects.create(dates=[datetime.date(2014, 1, 1)])
+        field = DateModel._meta.get_field_by_name('dates')[0]
+        calls = []
+        to_python = field.to_python
+        field.to_python = lambda value: calls.append(value) or to_python(value)
+        try:
+            obj = DateModel.objects.get(pk=obj.pk)
+            self.assertEqual(calls, [])
+            self.assertEqual(obj.dates, [datetime.date(2014, 1, 1)])
+            self.assertEqual(obj.dates, [datetime.date(2014, 1, 1)])
+            self.assertEqual(len(calls), 1)
+        finally:
+            del field.to_python
+
+    @unittest.skipIf(django.VERSION[:2] < (1, 8), "requires django >= 1.8")
+    def test_values_list_values_are_converted(self):
+        MacAddrModel.objects.create(field=['00:24:d6:54:ff:c6'])
+        dates = [datetime.date(2014, 1, 1)]
+        DateModel.objects.create(dates=dates)
+
+        self.assertEqual(list(MacAddrModel.objects.values_list('field', flat=True)), [['00:24:d6:54:ff:c6']])
+        self.assertEqual(list(DateModel.objects.values_list('dates', flat=True)), [dates])
+        self.assertEqual(list(DateModel.objects.values('dates')), [{'dates': dates}])
+
     def test_choices_validation(self):
         obj = ChoicesModel(choices=['A'])
         obj.full_clean()
         obj.save()
 
+    def test_choices_validation_reports_all_invalid_values(self):
+        field = ChoicesModel._meta.get_field_by_name('choices')[0]
+        field.validate(['A', 'B', 'A'], None)
+        with self.assertRaises(ValidationError) as cm:
+            field.validate(['C', 'A', 'D', 'C'], None)
+        self.assertEqual(cm.exception.messages, [u'Values C, D are not valid choices.'])
+
+        field = ArrayField(dbtype='text', dimension=2, choices=[('x', 'X'), ('Group', [('y', 'Y')])])
+        field.validate([['x', 'y'], ['y', 'x']], None)
+        self.assertRaises(ValidationError, field.validate, [['x', 'z']], None)
+
+        self.assertIs(field.get_choice_values(), field.get_choice_values())
+
+        field._choices = field.choices + [('z', 'Z')]
+        field.validate([['x', 'z']], None)
+
+        field._choices = [('w', 'W')] + field.choices[1:]
+        self.assertRaises(ValidationError, field.validate, [['x']], None)
+        field.validate([['w']], None)
+
+        # Empty elements are checked against null and blank, not choices
+        field = ArrayField(dbtype='text', choices=[('a', 'A')])
+        field.validate(['a', None, ''], None)
+        field = ArrayField(dbtype='text', choices=[('a', 'A')], null=False)
+        self.assertRaisesMessage(ValidationError, 'cannot be null', field.validate, ['a', None], None)
+
+    def test_element_constraints_validation(self):
+        field = ConstrainedModel._meta.get_field_by_name('tags')[0]
+        field.validate(['a', 'b', None], None)
+        self.assertRaisesMessage(ValidationError, 'at most 3 elements (it has 4)',
+                                 field.validate, ['a', 'b', 'c', 'd'], None)
+        self.assertRaisesMessage(ValidationError, 'Values a are repeated.',
+                                 field.validate, ['a', 'a', 'b'], None)
+        self.assertRaisesMessage(ValidationError, 'Elements must be sorted.',
+                                 field.validate, ['b', 'a'], None)
+
+    @unittest.skipIf(django.VERSION[:2] < (1, 7), "requires django >= 1.7")
+    def test_element_constraints_check(self):
+        field = ConstrainedModel._meta.get_field_by_name('tags')[0]
+        self.assertEqual(field.db_parameters(connection)['check'],
+                         'cardinality("tags") <= 3 AND djorm_pgarray_is_unique("tags") '
+                         'AND djorm_pgarray_is_sorted("tags" COLLATE "C")')
+        self.assertIsNone(ArrayField(dbtype='text').db_parameters(connection)['check'])
+
+        ConstrainedModel.objects.create(tags=['a', 'b', 'c'])
+        for tags in (['a', 'b', 'c', 'd'], ['a', 'a'], ['b', 'a']):
+            with transaction.atomic():
+                self.assertRaises(IntegrityError, ConstrainedModel.objects.create, tags=tags)
+
+    @unittest.skipIf(django.VERSION[:2] < (1, 7), "requires django >= 1.7")
+    def test_sorted_items_use_codepoint_order(self):
+        field = ConstrainedModel._meta.get_field_by_name('tags')[0]
+        # Sorted by codepoint, not by a linguistic collation
+        for tags in (['B', 'a'], ['a', 'z', u'\xe9']):
+            field.validate(tags, None)
+            ConstrainedModel.objects.create(tags=tags)
+        for tags in (['a', 'B'], [u'\xe9', 'z']):
+            self.assertRaises(ValidationError, field.validate, tags, None)
+            with transaction.atomic():
+                self.assertRaises(IntegrityError, ConstrainedModel.objects.create, tags=tags)
+
 
 if django.VERSION[:2] >= (1, 7):
     class AdditionalArrayFieldTests(TestCase):
@@ -275,11 +528,13 @@ if django.VERSION[:2] >= (1, 7):
             self.assertEqual(qs.count(), 1)
             self.assertSequenceEqual(qs[0].field, [1, 2])
 
-            # TODO: temporary not supported nested index search :(
-            # obj = IntModel.objects.create(field2=[[1, 2], [3, 4]])
-            # obj = IntModel.objects.create(field2=[[5, 6], [7, 8]])
-            # qs = IntModel.objects.filter(field2__0__0=1)
-            # self.assertEqual(qs.count(), 1)
+            obj = IntModel.objects.create(field2=[[1, 2], [3, 4]])
+            obj = IntModel.objects.create(field2=[[5, 6], [7, 8]])
+            qs = IntModel.objects.filter(field2__0__0=1)
+            self.assertEqual(qs.count(), 1)
+            self.assertEqual(IntModel.objects.filter(field2__1__0__gte=3).count(), 2)
+            self.assertEqual(IntModel.objects.filter(field2__1__contains=[8]).count(), 1)
+            self.assertIn('"field2"[2][1]', str(IntModel.objects.filter(field2__1__0=3).query))
 
         def test_slice(self):
             obj = IntModel.objects.create(field=[2])
@@ -290,7 +545,6 @@ if django.VERSION[:2] >= (1, 7):
             qs = IntModel.objects.filter(field__0_1=[2])
             self.assertEqual(qs.count(), 2)
 
-        @unittest.expectedFailure
         def test_index_1(self):
             obj = IntModel.objects.create(field2=[[1, 2], [3, 4]])
             obj = IntModel.objects.create(field2=[[5, 6], [7, 8]])
@@ -298,6 +552,20 @@ if django.VERSION[:2] >= (1, 7):
             qs = IntModel.objects.filter(field2__0=[1, 2])
             self.assertEqual(qs.count(), 1)
 
+            qs = IntModel.objects.filter(field2__0__0_1=[5])
+            self.assertEqual(qs.count(), 1)
+
+        def test_index_3d(self):
+            field = IntegerArrayField(dimension=3)
+            self.assertEqual(subscript_output_field(field, 1)._dimension, 3)
+            self.assertEqual(subscript_output_field(field, 2)._dimension, 1)
+
+            value = "'{{{1,2},{3,4}},{{5,6},{7,8}}}'::int[]"
+            cursor = connection.cursor()
+            for indexes, expected in (([2], [[[5, 6], [7, 8]]]), ([2, 1], [5, 6]), ([2, 1, 2], 6)):
+                cursor.execute("SELECT %s" % subscript_sql(value, indexes, 3, wrap=True))
+                self.assertEqual(cursor.fetchone()[0], expected)
+
         def test_len(self):
             obj = IntModel.objects.create(field=[1, 2])
             obj = IntModel.objects.create(field=[2, 3, 4])
@@ -305,6 +573,17 @@ if django.VERSION[:2] >= (1, 7):
             qs = IntModel.objects.filter(field__len__lte=2)
             self.assertEqual(qs.count(), 1)
 
+        def test_dimension_transforms(self):
+            obj1 = IntModel.objects.create(field=[], field2=[[1, 2, 3], [4, 5, 6]])
+            obj2 = IntModel.objects.create(field=[1], field2=[[1], [2]])
+
+            self.assertEqual([obj1], list(IntModel.objects.filter(field__cardinality=0)))
+            self.assertEqual([obj1], list(IntModel.objects.filter(field2__cardinality__gt=4)))
+            self.assertEqual([obj1], list(IntModel.objects.filter(field2__len_2=3)))
+            self.assertEqual(2, IntModel.objects.filter(field2__len_1=2, field2__ndims=2).count())
+            self.assertEqual([obj2], list(IntModel.objects.filter(field2__dims='[1:2][1:1]')))
+            self.assertRaises(FieldError, IntModel.objects.filter, field__len_2=1)
+
         def test_contains_lookup(self):
             obj1 = IntModel.objects.create(field=[1, 4, 3])
             obj2 = IntModel.objects.create(field=[0, 10, 50])
@@ -412,6 +691,112 @@ if django.VERSION[:2] >= (1, 7):
             self.assertEqual(i2, Item2.objects.get(tags__any_contains='ont'))
             self.assertEqual(2, Item2.objects.filter(tags__any_icontains='ont').count())
 
+        def test_deconstruct_gin_index(self):
+            af = ArrayField(gin_index=True, gin_opclass='gin__int_ops')
+            name, path, args, kwargs = af.deconstruct()
+            self.assertEqual(kwargs, {'gin_index': True, 'gin_opclass': 'gin__int_ops'})
+
+        def test_gin_index_check(self):
+            self.assertEqual(GinModel._meta.get_field_by_name('ints')[0].check(), [])
+
+            field = IntegerArrayField(gin_index=True)
+            field.set_attributes_from_name('other')
+            field.model = GinModel
+            self.assertEqual([error.id for error in field.check()], ['djorm_pgarray.W001'])
+
+        def test_gin_index_used_by_operators(self):
+            for i in range(20):
+                GinModel.objects.create(ints=[i, i + 1], tags=[str(i)])
+
+            for lookup in ('contains', 'contained_by', 'overlap'):
+                plan = explain(GinModel.objects.filter(**{'ints__' + lookup: [1, 2]}))
+                self.assertIn("pg_array_fields_ginmodel_ints_gin", plan)
+
+                plan = explain(GinModel.objects.filter(**{'tags__' + lookup: ['1']}))
+                self.assertIn("pg_array_fields_ginmodel_tags_gin", plan)
+
+        def test_gin_index_operation_sql(self):
+            from djorm_pgarray.operations import CreateGinIndex
+
+            field = GinModel._meta.get_field_by_name('ints')[0]
+            operation = CreateGinIndex('GinModel', 'ints', opclass='gin__int_ops', concurrently=True)
+            with connection.schema_editor() as editor:
+                sql = operation.create_sql(editor, GinModel, field)
+
+            self.assertEqual(sql, [
+                'CREATE INDEX CONCURRENTLY "pg_array_fields_ginmodel_ints_gin" '
+                'ON "pg_array_fields_ginmodel" USING gin ("ints" gin__int_ops)'
+            ])
+
+        def test_expression_index_operation_sql(self):
+            from djorm_pgarray.operations import CreateExpressionIndex
+
+            with connection.schema_editor() as editor:
+                operation = CreateExpressionIndex('IntModel', 'field2__0__1')
+                sql = operation.create_sql(editor, IntModel, operation.get_field(IntModel))
+                self.assertEqual(sql, [
+                    'CREATE INDEX "pg_array_fields_intmodel_field2_0_1_expr" '
+                    'ON "pg_array_fields_intmodel" (("field2"[1][2]))'
+                ])
+
+                operation = CreateExpressionIndex('IntModel', 'field__len')
+                sql = operation.create_sql(editor, IntModel, operation.get_field(IntModel))
+                self.assertEqual(sql, [
+                    'CREATE INDEX "pg_array_fields_intmodel_field_len_expr" '
+                    'ON "pg_array_fields_intmodel" ((array_length("field", 1)))'
+                ])
+
+        def test_expression_index_used_by_transforms(self):
+            for i in range(20):
+                TextModel.objects.create(field=[str(i), 'x'])
+
+            plan = explain(TextModel.objects.filter(field__0='7'))
+            self.assertIn("pg_array_fields_textmodel_field_0_expr", plan)
+
+            plan = explain(IntModel.objects.filter(field__len__gt=10))
+            self.assertIn("pg_array_fields_intmodel_field_len_expr", plan)
+
+        def test_intarray_lookups(self):
+            obj1 = IntModel.objects.create(field=[3, 1, 2, 2])
+            obj2 = IntModel.objects.create(field=[4, 5])
+            obj3 = IntModel.objects.create(field=[])
+
+            self.assertEqual([obj1], list(IntModel.objects.filter(field__query="1&(2|4)")))
+            self.assertEqual([obj2], list(IntModel.objects.filter(field__icount__lt=3,
+                                                                  field__icount__gt=0)))
+            self.assertEqual([obj1], list(IntModel.objects.filter(field__sort=[1, 2, 2, 3])))
+            self.assertEqual([obj1], list(IntModel.objects.filter(field__uniq=[3, 1, 2])))
+            self.assertEqual([obj2], list(IntModel.objects.filter(field__idx_5=2)))
+            self.assertEqual([obj1], list(IntModel.objects.filter(field__subarray_1_2=[1, 2])))
+
+        def test_intarray_operators_with_untyped_values(self):
+            obj1 = IntarrayModel.objects.create(values=[1, 2])
+            obj2 = IntarrayModel.objects.create(values=[])
+
+            self.assertEqual(2, IntarrayModel.objects.filter(values__contains=[]).count())
+            self.assertEqual([obj2], list(IntarrayModel.objects.filter(values__contained_by=[])))
+            self.assertEqual([obj1], list(IntarrayModel.objects.filter(values__overlap=[2, 3])))
+
+        def test_intarray_operators_are_opt_in(self):
+            sql = str(IntarrayModel.objects.filter(values__contains=[1]).query)
+            self.assertIn('"values" @> ', sql)
+            self.assertIn('::int4[]', sql)
+
+            # NULL elements and multidimensional arrays are rejected by intarray
+            obj1 = IntModel.objects.create(field=[1, None], field2=[[1, 2], [3, 4]])
+            IntModel.objects.create(field=[], field2=[])
+            self.assertIn('OPERATOR(pg_catalog.@>)', str(IntModel.objects.filter(field__contains=[1]).query))
+            self.assertEqual([obj1], list(IntModel.objects.filter(field__contains=[1])))
+            self.assertEqual([obj1], list(IntModel.objects.filter(field2__overlap=[4])))
+
+            for i in range(20):
+                IntarrayModel.objects.create(values=[i, i + 1])
+            plan = explain(IntarrayModel.objects.filter(values__contains=[1, 2]))
+            self.assertIn("pg_array_fields_intarraymodel_values_gin", plan)
+
+            self.assertRaises(ImproperlyConfigured, IntegerArrayField, intarray=True, dimension=2)
+            self.assertRaises(ImproperlyConfigured, IntegerArrayField, intarray=True, dbtype='bigint')
+
         def test_lookup_text_stubs_in_multiple_dimensions(self):
             """
             Tests whether we're able to lookup text stubs in more than one dimension
@@ -424,6 +809,381 @@ if django.VERSION[:2] >= (1, 7):
             self.assertEqual(mtm1, MTextModel.objects.get(data__any_contains='is'))
             self.assertEqual(2, MTextModel.objects.filter(data__any_icontains='is').count())
 
+        def test_lookup_text_stubs_combined_with_other_filters(self):
+            """
+            Tests that substring lookups are evaluated per row together with the rest of the query
+            """
+            tm1 = TextModel.objects.create(field=['a.v1', 'b.v1'])
+            tm2 = TextModel.objects.create(field=['a.v2'])
+
+            qs = TextModel.objects.filter(field__any_startswith='a').exclude(pk=tm1.pk)
+            self.assertNotIn("DISTINCT", str(qs.query))
+            self.assertEqual([tm2], list(qs))
+            self.assertEqual([tm2], list(TextModel.objects.exclude(field__any_endswith='1')))
+
+        def test_lookup_text_stubs_with_trigram_index(self):
+            """
+            Tests that substring lookups on trigram indexed fields keep per element semantics
+            and are served by the index
+            """
+            t1 = TrigramModel.objects.create(tags=['alpha', 'beta'])
+            t2 = TrigramModel.objects.create(tags=['gamma', 'Alphabet'])
+
+            self.assertEqual([t1], list(TrigramModel.objects.filter(tags__any_startswith='alp')))
+            self.assertEqual([t2], list(TrigramModel.objects.filter(tags__any_endswith='bet')))
+            self.assertEqual(2, TrigramModel.objects.filter(tags__any_icontains='LPHA').count())
+            # Matches the flattened array but no single element
+            self.assertEqual(0, TrigramModel.objects.filter(tags__any_contains='betagam').count())
+
+            plan = explain(TrigramModel.objects.filter(tags__any_contains='alph'))
+            self.assertIn("pg_array_fields_trigrammodel_tags_trgm", plan)
+
+        def test_any_value_lookup(self):
+            objs = [IntModel.objects.create(field=[i]) for i in range(5)]
+            ids = [objs[3].pk, objs[1].pk, 0]
+
+            qs = IntModel.objects.filter(id__any=ids).order_by('pk')
+            self.assertEqual(list(qs), [objs[1], objs[3]])
+            sql, params = qs.query.sql_with_params()
+            self.assertIn('= ANY(%s::int[])', sql)
+            self.assertEqual(len(params), 1)
+            self.assertEqual(IntModel.objects.filter(id__any=[]).count(), 0)
+
+            Author.objects.create(name='x')
+            qs = Author.objects.filter(name__any=['x', 'y'])
+            self.assertIn('::varchar[]', str(qs.query))
+            self.assertEqual(qs.count(), 1)
+            self.assertRaises(FieldError, IntModel.objects.filter, field__any=[[1]])
+            self.assertRaises(ValueError, IntModel.objects.filter, id__any=IntModel.objects.values('id'))
+
+            # Fields without a known array type do not get the lookup
+            from django.db.models import TimeField
+            self.assertIsNone(TimeField().get_lookup('any'))
+
+
+if django.VERSION[:2] >= (1, 8):
+    class ArrayExpressionTests(TestCase):
+        def setUp(self):
+            TextModel.objects.all().delete()
+
+        def test_array_agg(self):
+            from djorm_pgarray.expressions import ArrayAgg
+
+            tm1 = TextModel.objects.create(field=['a', 'b'])
+            tm2 = TextModel.objects.create(field=['b'])
+
+            ids = TextModel.objects.aggregate(ids=ArrayAgg('id'))['ids']
+            self.assertEqual(sorted(ids), [tm1.pk, tm2.pk])
+            self.assertIsInstance(ArrayAgg('id').resolve_expression(TextModel.objects.all().query).output_field,
+                                  IntegerArrayField)
+
+            IntModel.objects.create(field=[1, 2])
+            IntModel.objects.create(field=[1, 2])
+            result = IntModel.objects.aggregate(fields=ArrayAgg('field', distinct=True))
+            self.assertEqual(result['fields'], [[1, 2]])
+
+        def test_unnest(self):
+            from djorm_pgarray.expressions import Unnest
+
+            TextModel.objects.create(field=['a', 'b'])
+            TextModel.objects.create(field=['b', 'c'])
+            tags = TextModel.objects.annotate(tag=Unnest('field')).values_list('tag', flat=True)
+            self.assertEqual(sorted(tags), ['a', 'b', 'b', 'c'])
+
+            IntModel.objects.create(field2=[[1, 2], [3, 4]])
+            values = IntModel.objects.annotate(value=Unnest('field2')).values_list('value', flat=True)
+            self.assertEqual(list(values), [1, 2, 3, 4])
+
+        def test_array_cat(self):
+            from django.db.models import Value
+            from djorm_pgarray.expressions import ArrayCat
+
+            obj = TextModel.objects.create(field=['a', 'b'])
+            self.assertEqual(TextModel.objects.annotate(both=ArrayCat('field', 'field')).get().both,
+                             ['a', 'b', 'a', 'b'])
+
+            TextModel.objects.update(field=ArrayCat('field', Value(['c'])))
+            self.assertEqual(TextModel.objects.get(pk=obj.pk).field, ['a', 'b', 'c'])
+
+        def test_array_index(self):
+            from djorm_pgarray.expressions import ArrayIndex, ArraySlice
+
+            IntModel.objects.create(field=[3, 1], field2=[[1, 2], [3, 4]])
+            IntModel.objects.create(field=[2, 9], field2=[[5, 6], [7, 8]])
+
+            qs = IntModel.objects.annotate(cell=ArrayIndex('field2', 1, 0)).order_by('-cell')
+            self.assertEqual(list(qs.values_list('cell', flat=True)), [7, 3])
+
+            qs = IntModel.objects.annotate(row=ArrayIndex('field2', 0)).order_by('id')
+            self.assertEqual(list(qs.values_list('row', flat=True)), [[1, 2], [5, 6]])
+
+            qs = IntModel.objects.annotate(first=ArraySlice('field', 0, 1)).order_by('first')
+            self.assertEqual(list(qs.values_list('first', flat=True)), [[2], [3]])
+
+        def test_update_expressions(self):
+            from djorm_pgarray.expressions import (ArrayAppend, ArrayPrepend, ArrayRemove,
+                                                   ArrayReplace, ArraySetItem)
+
+            obj = TextModel.objects.create(field=['a', 'b'])
+            qs = TextModel.objects.filter(pk=obj.pk)
+
+            qs.update(field=ArrayAppend('field', 'c'))
+            self.assertEqual(qs.get().field, ['a', 'b', 'c'])
+            qs.update(field=ArrayPrepend('field', 'b'))
+            self.assertEqual(qs.get().field, ['b', 'a', 'b', 'c'])
+            qs.update(field=ArrayRemove('field', 'b'))
+            self.assertEqual(qs.get().field, ['a', 'c'])
+            qs.update(field=ArrayReplace('field', 'c', 'd'))
+            self.assertEqual(qs.get().field, ['a', 'd'])
+
+            qs.update(field=ArraySetItem('field', 0, 'x'))
+            self.assertEqual(qs.get().field, ['x', 'd'])
+            qs.update(field=ArraySetItem('field', 1, 'y'))
+            self.assertEqual(qs.get().field, ['x', 'y'])
+            self.assertEqual(qs.filter(field__1='y').count(), 1)
+
+            qs.update(field=ArraySetItem(ArrayAppend('field', 'z'), 0, 'w'))
+            self.assertEqual(qs.get().field, ['w', 'y', 'z'])
+
+            IntModel.objects.create(field=[1, 2])
+            IntModel.objects.update(field=ArrayAppend('field', 3))
+            self.assertEqual(IntModel.objects.get().field, [1, 2, 3])
+
+
+class ArrayTrackingTests(TestCase):
+    def test_has_changed(self):
+        obj = TrackedModel.objects.create(tags=['a'], values=[1, 2])
+        obj = TrackedModel.objects.get(pk=obj.pk)
+        self.assertEqual(obj.get_changed_array_fields(), [])
+
+        obj.values.append(3)
+        obj.tags = ['a']
+        self.assertTrue(obj.has_changed('values'))
+        self.assertFalse(obj.has_changed('tags'))
+
+        obj.tags = ('b',)
+        self.assertEqual(obj.get_changed_array_fields(), ['tags', 'values'])
+
+    def test_save_skips_unchanged_arrays(self):
+        from django.test.utils import CaptureQueriesContext
+
+        obj = TrackedModel.objects.create(tags=['a'], values=[1, 2])
+        obj = TrackedModel.objects.get(pk=obj.pk)
+        obj.name = 'renamed'
+        obj.values[0] = 5
+        with CaptureQueriesContext(connection) as queries:
+            obj.save()
+        self.assertEqual(len(queries), 1)
+        self.assertIn('"values"', queries[0]['sql'])
+        self.assertNotIn('"tags"', queries[0]['sql'])
+
+        with CaptureQueriesContext(connection) as queries:
+            obj.save()
+        self.assertNotIn('"values"', queries[0]['sql'])
+
+        obj = TrackedModel.objects.get(pk=obj.pk)
+        self.assertEqual((obj.name, obj.tags, obj.values), ('renamed', ['a'], [5, 2]))
+
+        obj = TrackedModel.objects.only('id', 'tags').get(pk=obj.pk)
+        obj.tags = ['b']
+        obj.save()
+        self.assertEqual(TrackedModel.objects.get(pk=obj.pk).tags, ['b'])
+
+    def test_save_inserts_deleted_rows(self):
+        from django.db.models.signals import pre_save
+
+        obj = TrackedModel.objects.create(tags=['a'], values=[1])
+        obj = TrackedModel.objects.get(pk=obj.pk)
+        TrackedModel.objects.filter(pk=obj.pk).delete()
+
+        update_fields = []
+        receiver = lambda sender, **kwargs: update_fields.append(kwargs['update_fields'])
+        pre_save.connect(receiver, sender=TrackedModel)
+        try:
+            obj.save()
+        finally:
+            pre_save.disconnect(receiver, sender=TrackedModel)
+        self.assertEqual(update_fields, [None])
+
+        obj = TrackedModel.objects.get(pk=obj.pk)
+        self.assertEqual((obj.tags, obj.values), (['a'], [1]))
+
+    def test_deferred_arrays_are_unchanged_when_loaded(self):
+        obj = TrackedModel.objects.create(tags=['a'], values=[1])
+        obj = TrackedModel.objects.defer('tags').get(pk=obj.pk)
+        self.assertFalse(obj.has_changed('tags'))
+        self.assertEqual(obj.tags, ['a'])
+        self.assertFalse(obj.has_changed('tags'))
+        obj.tags.append('b')
+        self.assertEqual(obj.get_changed_array_fields(), ['tags'])
+
+    @unittest.skipIf(django.VERSION[:2] < (1, 8), "requires django >= 1.8")
+    def test_refreshed_arrays_are_unchanged(self):
+        from django.test.utils import CaptureQueriesContext
+
+        obj = TrackedModel.objects.create(tags=['a'], values=[1])
+        TrackedModel.objects.filter(pk=obj.pk).update(values=[2])
+        obj.refresh_from_db()
+        self.assertEqual(obj.values, [2])
+        self.assertEqual(obj.get_changed_array_fields(), [])
+        with CaptureQueriesContext(connection) as queries:
+            obj.save()
+        self.assertNotIn('"values"', queries[0]['sql'])
+
+    @unittest.skipIf(django.VERSION[:2] < (1, 8), "requires django >= 1.8")
+    def test_save_writes_array_deltas(self):
+        from django.db.models.signals import post_save, pre_save
+        from django.test.utils import CaptureQueriesContext
+
+        obj = TrackedModel.objects.create(tags=['a', 'b', 'a', 'c'], values=list(range(100)))
+        obj = TrackedModel.objects.get(pk=obj.pk)
+        obj.values.extend([100, 101])
+        obj.tags.remove('a')
+        obj.tags.remove('a')
+        with CaptureQueriesContext(connection) as queries:
+            obj.save()
+        self.assertIn('"values" || ', queries[0]['sql'])
+        self.assertIn('array_remove("pg_array_fields_trackedmodel"."tags"', queries[0]['sql'])
+        self.assertNotIn('99', queries[0]['sql'])
+        self.assertEqual(obj.values, list(range(102)))
+        self.assertFalse(obj.has_changed('values'))
+
+        seen = []
+        receiver = lambda sender, instance, **kwargs: seen.append(instance.__dict__['values'])
+        pre_save.connect(receiver, sender=TrackedModel)
+        post_save.connect(receiver, sender=TrackedModel)
+        try:
+            obj.values.append(102)
+            obj.save()
+        finally:
+            pre_save.disconnect(receiver, sender=TrackedModel)
+            post_save.disconnect(receiver, sender=TrackedModel)
+        self.assertEqual(seen, [list(range(103))] * 2)
+
+        obj = TrackedModel.objects.get(pk=obj.pk)
+        self.assertEqual(obj.tags, ['b', 'c'])
+        self.assertEqual(obj.values, list(range(103)))
+
+        # Not a pure append or removal
+        obj.tags = ['c', 'b']
+        with CaptureQueriesContext(connection) as queries:
+            obj.save()
+        self.assertNotIn('array_remove', queries[0]['sql'])
+        self.assertEqual(TrackedModel.objects.get(pk=obj.pk).tags, ['c', 'b'])
+
+
+class ArrayForeignKeyTests(TestCase):
+    def setUp(self):
+        self.authors = [Author.objects.create(name=name) for name in ('a', 'b', 'c')]
+
+    def test_accessor(self):
+        a, b, c = self.authors
+        book = Book.objects.create(author_ids=[c.pk, a.pk, 0])
+        book = Book.objects.get(pk=book.pk)
+        self.assertEqual(book.authors, [c, a])
+        self.assertEqual(book.authors.ids, (c.pk, a.pk, 0))
+
+        book.author_ids = [b.pk]
+        self.assertEqual(book.authors, [b])
+
+        book.authors = [a, b]
+        self.assertEqual(book.author_ids, [a.pk, b.pk])
+        book.save()
+        self.assertEqual(Book.objects.get(pk=book.pk).authors, [a, b])
+        self.assertEqual(list(Book.objects.filter(author_ids__contains=[b.pk])), [book])
+
+    def test_prefetch_related(self):
+        from django.test.utils import CaptureQueriesContext
+
+        a, b, c = self.authors
+        Book.objects.create(author_ids=[b.pk, a.pk])
+        Book.objects.create(author_ids=[c.pk, b.pk])
+        Book.objects.create(author_ids=[b.pk, a.pk])
+        Book.objects.create(author_ids=[])
+
+        with CaptureQueriesContext(connection) as queries:
+            books = list(Book.objects.order_by('pk').prefetch_related('authors'))
+            self.assertEqual([book.authors for book in books], [[b, a], [c, b], [b, a], []])
+        self.assertEqual(len(queries), 2)
+        self.assertIn('= ANY(', queries[1]['sql'])
+
+
+class CopyInsertTests(TestCase):
+    def test_copy_insert_text_arrays(self):
+        from djorm_pgarray.bulk import copy_insert
+
+        values = [
+            [u'a"b', u'c\\d', u'x,y', u'{}', u'NULL', u'', None, u'tab\there', u'new\nline', u'ñ'],
+            [],
+            None,
+        ]
+        count = copy_insert(TextModel, [TextModel(field=value) for value in values])
+        self.assertEqual(count, 3)
+        self.assertEqual(list(TextModel.objects.order_by('id').values_list('field', flat=True)),
+                         values)
+
+        copy_insert(MTextModel, [MTextModel(data=[[u"1", u"2"], [u"3", u"ñ"]])])
+        self.assertEqual(MTextModel.objects.get().data, [[u"1", u"2"], [u"3", u"ñ"]])
+
+    def test_copy_insert_other_types(self):
+        from djorm_pgarray.bulk import copy_insert
+
+        copy_insert(IntModel, [IntModel(field=[1, None, "3"], field2=[[1, 2], [3, 4]])])
+        obj = IntModel.objects.get()
+        self.assertEqual(obj.field, [1, None, 3])
+        self.assertEqual(obj.field2, [[1, 2], [3, 4]])
+
+        d = datetime.date(2011, 11, 11)
+        copy_insert(DateModel, (DateModel(dates=[d]) for i in range(2)))
+        self.assertEqual([[d], [d]], list(DateModel.objects.values_list('dates', flat=True)))
+
+        data = [memoryview(b'\x01\\\x00'), memoryview(b'\x02')]
+        copy_insert(BytesArrayModel, [BytesArrayModel(entries=data)])
+        entries = BytesArrayModel.objects.get().entries
+        self.assertEqual([memoryview(x).tobytes() for x in entries], [b'\x01\\\x00', b'\x02'])
+
+    @unittest.skipIf(django.VERSION[:2] < (1, 6), "requires django >= 1.6")
+    def test_copy_insert_encodes_binary_columns(self):
+        from django.db.models import BinaryField
+        from djorm_pgarray.bulk import _column_encoder
+
+        encode = _column_encoder(BinaryField(), connection)
+        self.assertEqual(encode(b'\x01\\'), u'\\\\x015c')
+        self.assertEqual(encode(None), u'\\N')
+
+
+class CopyExportTests(TestCase):
+    def test_copy_export(self):
+        from djorm_pgarray.bulk import copy_export, copy_export_ndjson
+
+        values = [[u'a"b', u'c\\d', u'x,y', u'', None, u'tab\there', u'new\nline', u'ñ'], [], None]
+        for value in values:
+            TextModel.objects.create(field=value)
+        IntModel.objects.create(field=[1, None], field2=[[1, 2], [3, 4]])
+
+        rows = []
+        count = copy_export(TextModel.objects.order_by('id'), rows.append, fields=['field'])
+        self.assertEqual(count, 3)
+        self.assertEqual(rows, [(value,) for value in values])
+
+        rows = []
+        copy_export(IntModel.objects.all(), rows.append)
+        self.assertEqual(rows[0][1:], ([1, None], [[1, 2], [3, 4]]))
+
+        stream = six.StringIO()
+        copy_export_ndjson(IntModel.objects.all(), stream, fields=['field2'])
+        self.assertEqual(stream.getvalue(), u'{"field2": [[1, 2], [3, 4]]}\n')
+
+    @unittest.skipIf(numpy is None, "numpy is not installed")
+    def test_copy_export_ndjson_numpy_arrays(self):
+        from djorm_pgarray.bulk import copy_export_ndjson
+
+        NumpyModel.objects.create(vector=[1.5, 2.5], matrix=[[1, 2], [3, 4]])
+
+        stream = six.StringIO()
+        copy_export_ndjson(NumpyModel.objects.all(), stream, fields=['matrix'])
+        self.assertEqual(stream.getvalue(), u'{"matrix": [[1, 2], [3, 4]]}\n')
+
 
 class ArrayFormFieldTests(TestCase):
     def test_regular_forms(self):
@@ -460,3 +1220,30 @@ class ArrayFormFieldTests(TestCase):
             form.errors['field'],
             [u'Enter a list of values, joined by commas.  E.g. "a,b,c".']
         )
+
+    def test_clean_coerces_and_checks_length(self):
+        field = ArrayFormField(coerce=int, max_length=3, min_length=2)
+        self.assertEqual(field.clean(u'1, 2 ,3'), [1, 2, 3])
+        self.assertRaisesMessage(forms.ValidationError, 'at most 3 elements (it has 4)',
+                                 field.clean, u'1,2,3,4')
+        self.assertRaisesMessage(forms.ValidationError, 'at least 2 elements (it has 1)',
+                                 field.clean, u'1')
+        self.assertRaisesMessage(forms.ValidationError, 'Enter valid values: a, b.',
+                                 field.clean, u'a,2,b')
+
+        form = IntArrayForm({'field': u'1, 2'})
+        self.assertTrue(form.is_valid())
+        self.assertEqual(form.cleaned_data['field'], [1, 2])
+
+    def test_clean_numeric_elements(self):
+        field = ArrayField(dbtype="numeric").formfield()
+        self.assertEqual(field.clean(u'1.5, 2'), [decimal.Decimal('1.5'), decimal.Decimal('2')])
+        self.assertRaisesMessage(forms.ValidationError, 'Enter valid values: abc.',
+                                 field.clean, u'1,abc')
+
+    def test_clean_choices(self):
+        choices = [('a', 'A'), ('Group', [('b', 'B'), ('c', 'C')])]
+        field = ArrayFormField(choices=choices)
+        self.assertEqual(field.clean(u'a,c'), [u'a', u'c'])
+        self.assertRaisesMessage(forms.ValidationError, 'x, y are not among the available choices',
+                                 field.clean, u'x,b,y')